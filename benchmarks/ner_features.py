@@ -0,0 +1,50 @@
+#coding=UTF-8
+"""
+Benchmark of the crf features of ShipiboNER with and without the per-type feature cache,
+on a corpus with a zipfian distribution of words taken from the gazetteers
+
+Usage: PYTHONPATH=. python benchmarks/ner_features.py [number of sentences]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+import chana.ner
+
+
+def corpus(size, length=15):
+    words=['Limanko','enra','atsawe','jawen','ainbo','joni','Pucallpain','bake','nokon','westiora','Enero','2017']
+    for name in ('per_esp_s.dat','loc_esp_s.dat','org_esp_s.dat'):
+        with open(os.path.join(os.path.dirname(chana.ner.__file__), 'files/ner', name), encoding='utf-8') as f:
+            words.extend(f.read().splitlines())
+    random.seed(0)
+    random.shuffle(words)
+    weights=[1.0 / (rank + 1) for rank in range(len(words))]
+    return [' '.join(random.choices(words, weights, k=length)) for _ in range(size)]
+
+
+def measure(ner, sentences):
+    tagged=[list(zip(sentence.split(), ner.predict_rule_tags(sentence))) for sentence in sentences]
+    tokens=sum(len(sent) for sent in tagged)
+    start=time.perf_counter()
+    for sent in tagged:
+        ner.sent2features(sent)
+    elapsed=time.perf_counter() - start
+    tracemalloc.start()
+    features=[ner.sent2features(sent) for sent in tagged]
+    memory=tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return features, tokens, elapsed, memory
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    sentences = corpus(size)
+    plain, tokens, plain_time, plain_memory = measure(chana.ner.ShipiboNER(feature_cache_size=0), sentences)
+    ner = chana.ner.ShipiboNER()
+    cached, tokens, cached_time, cached_memory = measure(ner, sentences)
+    assert plain == cached
+    print('%d tokens, %s' % (tokens, ner.feature_cache.stats()))
+    print('without cache %.2f us and %d bytes per token' % (plain_time / tokens * 1e6, plain_memory / tokens))
+    print('with cache    %.2f us and %d bytes per token' % (cached_time / tokens * 1e6, cached_memory / tokens))
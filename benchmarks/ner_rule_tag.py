@@ -0,0 +1,48 @@
+#coding=UTF-8
+"""
+Benchmark of the single pass rule tagger of ShipiboNER against the five passes of the check methods
+on long documents built from the gazetteers, the numbers, the months and shipibo words
+
+Usage: PYTHONPATH=. python benchmarks/ner_rule_tag.py [number of words]
+"""
+import os
+import random
+import sys
+import time
+import chana.ner
+
+
+def five_passes(ner, sentence):
+    words=sentence.split()
+    entity_tag=['O']*len(words)
+    ner.check_names(words,entity_tag)
+    ner.check_organizations(words,entity_tag)
+    ner.check_locations(words,entity_tag)
+    ner.check_numbers(words,entity_tag)
+    ner.check_dates(words,entity_tag)
+    return entity_tag
+
+
+def document(size):
+    words=['Limanko','enra','atsawe','jawen','ainbo','joni','Pucallpain','bake','nokon','westiora','rabé','Enero','2017','12']
+    for name in ('per_esp_s.dat','loc_esp_s.dat','org_esp_s.dat'):
+        with open(os.path.join(os.path.dirname(chana.ner.__file__), 'files/ner', name), encoding='utf-8') as f:
+            words.extend(f.read().splitlines()[::20])
+    words.extend(chana.ner.MONTHS)
+    words.extend(chana.ner.NUMBERS)
+    random.seed(0)
+    return ' '.join(random.choice(words) for _ in range(size))
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    ner = chana.ner.ShipiboNER()
+    sentence = document(size)
+    start = time.perf_counter()
+    expected = five_passes(ner, sentence)
+    five = time.perf_counter() - start
+    start = time.perf_counter()
+    tags = ner.predict_rule_tags(sentence)
+    single = time.perf_counter() - start
+    assert tags == expected
+    print('%d words, five passes %.3fs, single pass %.3fs, %.1fx' % (size, five, single, five / single))
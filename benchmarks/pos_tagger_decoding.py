@@ -0,0 +1,54 @@
+#coding=UTF-8
+"""
+Benchmark of the decoders of ShipiboPosTagger with the numpy backend: time per sentence, log-probability
+of the sequences found and agreement of the tags with the greedy decoder
+
+Usage: PYTHONPATH=. python benchmarks/pos_tagger_decoding.py [number of sentences] [sentence length]
+"""
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+import chana.pos_tagger
+
+
+def corpus(size, length):
+    path = os.path.join(os.path.dirname(chana.pos_tagger.__file__), chana.pos_tagger.LINEAR_MODEL, 'model.json')
+    with open(path, encoding='utf-8') as f:
+        words = sorted(name[5:] for name in json.load(f)['vocabulary'] if name.startswith('word='))
+    random.seed(0)
+    return [' '.join(random.choices(words, k=length)) for _ in range(size)]
+
+
+def log_probability(tagger, sentence, tags):
+    tokens = sentence.split(' ')
+    scores = tagger.static_scores([(tokens, i) for i in range(len(tokens))])
+    total = 0.0
+    for i, tag in enumerate(tags):
+        previous, second = tagger.history_rows(tags, i)
+        total += chana.pos_tagger.log_softmax(scores[i] + tagger.history[0][previous] + tagger.history[1][second])[tagger.tag_rows[tag] - 1]
+    return total
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    sentences = corpus(size, length)
+    greedy = chana.pos_tagger.ShipiboPosTagger(backend='numpy', score_cache_size=100000)
+    expected = [greedy.pos_tag(sentence) for sentence in sentences]
+    decoders = [('greedy', greedy)]
+    for width in (1, 2, 4, 8, 16):
+        decoders.append(('beam %d' % width, chana.pos_tagger.ShipiboPosTagger(backend='numpy', score_cache_size=100000,
+                                                                               decoder='beam', beam_width=width)))
+    decoders.append(('viterbi', chana.pos_tagger.ShipiboPosTagger(backend='numpy', score_cache_size=100000, decoder='viterbi')))
+    for name, tagger in decoders:
+        # the context scores are cached so that only the decoding is timed
+        tagger.pos_tag_many(sentences)
+        start = time.perf_counter()
+        tags = [tagger.pos_tag(sentence) for sentence in sentences]
+        elapsed = (time.perf_counter() - start) / size
+        agreement = np.mean([a == b for got, want in zip(tags, expected) for a, b in zip(got, want)])
+        score = np.mean([log_probability(greedy, sentence, got) for sentence, got in zip(sentences, tags)])
+        print('%-10s %7.3f ms/sentence   log-probability %8.3f   agreement with greedy %.4f' % (name, elapsed * 1000, score, agreement))
@@ -0,0 +1,54 @@
+#coding=UTF-8
+"""
+Benchmark of the throughput of ShipiboPosTagger with the numpy backend, with and without the cache
+of the scores of each word context, on a corpus with a zipfian distribution of the words of the model
+
+Usage: PYTHONPATH=. python benchmarks/pos_tagger_scores.py [number of sentences] [number of distinct words]
+"""
+import json
+import os
+import random
+import sys
+import time
+import chana.pos_tagger
+
+
+def corpus(size, vocabulary, length=12):
+    path = os.path.join(os.path.dirname(chana.pos_tagger.__file__), chana.pos_tagger.LINEAR_MODEL, 'model.json')
+    with open(path, encoding='utf-8') as f:
+        words = sorted(name[5:] for name in json.load(f)['vocabulary'] if name.startswith('word='))
+    random.seed(0)
+    random.shuffle(words)
+    words = words[:vocabulary]
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return [' '.join(random.choices(words, weights, k=length)) for _ in range(size)]
+
+
+def throughput(tag, sentences):
+    start = time.perf_counter()
+    tags = tag(sentences)
+    elapsed = time.perf_counter() - start
+    return tags, sum(len(sentence_tags) for sentence_tags in tags) / elapsed
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    vocabulary = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sentences = corpus(size, vocabulary)
+    plain = chana.pos_tagger.ShipiboPosTagger(backend='numpy')
+    cached = chana.pos_tagger.ShipiboPosTagger(backend='numpy', score_cache_size=100000)
+    expected, rate = throughput(lambda batch: [plain.pos_tag(sentence) for sentence in batch], sentences)
+    print('pos_tag                          %8.0f tokens/s' % rate)
+    for run in ('cold', 'warm'):
+        tags, rate = throughput(lambda batch: [cached.pos_tag(sentence) for sentence in batch], sentences)
+        assert tags == expected
+        print('pos_tag with score cache, %s   %8.0f tokens/s' % (run, rate))
+    print(cached.score_cache.stats())
+    tags, rate = throughput(plain.pos_tag_many, sentences)
+    assert tags == expected
+    print('pos_tag_many                     %8.0f tokens/s' % rate)
+    cached.score_cache.clear()
+    for run in ('cold', 'warm'):
+        tags, rate = throughput(cached.pos_tag_many, sentences)
+        assert tags == expected
+        print('pos_tag_many with cache, %s    %8.0f tokens/s' % (run, rate))
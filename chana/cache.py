@@ -0,0 +1,267 @@
+#coding=UTF-8
+"""
+Caches for the results of the chana tools.
+Bounded in-memory memoization with least-recently-used eviction and a persistent
+sqlite3 store that can be shared by several runs and processes
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entries and counts its hits and misses
+    """
+
+    def __init__(self, maxsize = 10000):
+        """
+        Constructor of the class with the maximum number of entries to be kept
+
+        :param maxsize: maximum number of entries
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default = None):
+        """ Method that returns the value of a key and marks it as recently used
+
+        :param key: key to be searched
+        :type key: object
+        :param default: value returned if the key is not in the cache
+        :type default: object
+        :returns: the value of the key or default
+        :rtype: object
+
+        :Example:
+
+        >>> import chana.cache
+        >>> cache = chana.cache.LRUCache(2)
+        >>> cache.put('pikanwe', 'piki')
+        >>> cache.get('pikanwe')
+        'piki'
+
+    """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """ Method that stores the value of a key, evicting the least recently used entry if the cache is full
+
+        :param key: key to be stored
+        :type key: object
+        :param value: value of the key
+        :type value: object
+        :returns: none
+        :rtype: None
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Method that removes all the entries, the statistics are kept
+
+        :returns: none
+        :rtype: None
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """ Method that returns the statistics of the cache
+
+        :returns: dict with the hits, misses, evictions, current size and maximum size
+        :rtype: dict
+
+        :Example:
+
+        >>> import chana.cache
+        >>> cache = chana.cache.LRUCache(2)
+        >>> cache.get('pikanwe')
+        >>> cache.stats()
+        {'hits': 0, 'misses': 1, 'evictions': 0, 'size': 0, 'maxsize': 2}
+
+    """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_fingerprints = {}
+
+def model_fingerprint(*paths):
+    """ Function that returns a fingerprint of the contents of some files, it changes when any of them changes
+
+        :param paths: paths of the model files
+        :type paths: str
+        :returns: hexadecimal sha1 of the files
+        :rtype: str
+
+        :Example:
+
+        >>> import chana.cache
+        >>> chana.cache.model_fingerprint('chana/files/ner/crf_ner.crfsuite')
+        'd05cd0d3b6735ef369e10e0733b7e2b81ee2c38d'
+
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in _fingerprints:
+            file_digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    file_digest.update(block)
+            _fingerprints[key] = file_digest.hexdigest()
+        digest.update(_fingerprints[key].encode('ascii'))
+    return digest.hexdigest()
+
+
+class PersistentCache:
+    """
+    Store of results in a sqlite3 database, keyed by namespace, model fingerprint and input,
+    that can be used at the same time by several threads and processes
+    """
+
+    def __init__(self, path, timeout = 30.0):
+        """
+        Constructor of the class that opens or creates the database
+
+        :param path: path of the database file
+        :type path: str
+        :param timeout: seconds to wait when another process is writing
+        :type timeout: float
+        """
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS results (namespace TEXT, fingerprint TEXT, key TEXT, value TEXT, '
+                               'PRIMARY KEY (namespace, fingerprint, key)) WITHOUT ROWID')
+
+    def connection(self):
+        """ Inner method that returns the connection of the current thread and process
+
+        :returns: connection to the database
+        :rtype: sqlite3.Connection
+        """
+        # a connection must not be used by another thread nor survive a fork
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=self.timeout)
+            self.local.connection.execute('PRAGMA journal_mode=WAL')
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get(self, namespace, fingerprint, key, default = None):
+        """ Method that returns a stored result
+
+        :param namespace: name of the tool that produced the result
+        :type namespace: str
+        :param fingerprint: fingerprint of the model that produced the result
+        :type fingerprint: str
+        :param key: input of the tool
+        :type key: str
+        :param default: value returned if the result is not stored
+        :type default: object
+        :returns: the result or default
+        :rtype: object
+
+        :Example:
+
+        >>> import chana.cache
+        >>> cache = chana.cache.PersistentCache('chana.db')
+        >>> cache.put('lemma', 'model', 'pikanwe', 'piki')
+        >>> cache.get('lemma', 'model', 'pikanwe')
+        'piki'
+
+    """
+        row = self.connection().execute('SELECT value FROM results WHERE namespace=? AND fingerprint=? AND key=?',
+                                        (namespace, fingerprint, key)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def get_many(self, namespace, fingerprint, keys):
+        """ Method that returns the stored results of several inputs
+
+        :param namespace: name of the tool that produced the results
+        :type namespace: str
+        :param fingerprint: fingerprint of the model that produced the results
+        :type fingerprint: str
+        :param keys: inputs of the tool
+        :type keys: list
+        :returns: dict with the results found by input
+        :rtype: dict
+        """
+        found = {}
+        keys = list(set(keys))
+        # sqlite limits the number of parameters of a query
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = 'SELECT key, value FROM results WHERE namespace=? AND fingerprint=? AND key IN (%s)' % ','.join('?' * len(chunk))
+            for key, value in self.connection().execute(query, [namespace, fingerprint] + chunk):
+                found[key] = json.loads(value)
+        return found
+
+    def put(self, namespace, fingerprint, key, value):
+        """ Method that stores a result
+
+        :param namespace: name of the tool that produced the result
+        :type namespace: str
+        :param fingerprint: fingerprint of the model that produced the result
+        :type fingerprint: str
+        :param key: input of the tool
+        :type key: str
+        :param value: result that can be serialized to json
+        :type value: object
+        :returns: none
+        :rtype: None
+        """
+        self.put_many(namespace, fingerprint, [(key, value)])
+
+    def put_many(self, namespace, fingerprint, items):
+        """ Method that stores several results in a single transaction
+
+        :param namespace: name of the tool that produced the results
+        :type namespace: str
+        :param fingerprint: fingerprint of the model that produced the results
+        :type fingerprint: str
+        :param items: (input, result) pairs
+        :type items: iterable
+        :returns: none
+        :rtype: None
+        """
+        rows = [(namespace, fingerprint, key, json.dumps(value, ensure_ascii=False)) for key, value in items]
+        with self.connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', rows)
+
+    def purge(self, namespace, fingerprint):
+        """ Method that deletes the results of a namespace produced by other models
+
+        :param namespace: name of the tool
+        :type namespace: str
+        :param fingerprint: fingerprint of the current model
+        :type fingerprint: str
+        :returns: none
+        :rtype: None
+        """
+        with self.connection() as connection:
+            connection.execute('DELETE FROM results WHERE namespace=? AND fingerprint!=?', (namespace, fingerprint))
@@ -3,12 +3,16 @@
 Lemmatizer for shipibo-konibo
 Source model is from the Chana project and a use KNeighborsClassifier from scikit-learn
 """
+import array
 import codecs
+import concurrent.futures
+import itertools
 import os
 import numpy as np
 from sklearn.externals import joblib
 from sklearn import neighbors
 import warnings
+from .cache import LRUCache, model_fingerprint
 
 warnings.filterwarnings("ignore")
 
@@ -51,19 +55,140 @@ def longest_common_substring(string1, string2):
         'liman'
         
     """
-    m = [[0] * (1 + len(string2)) for i in range(1 + len(string1))]
+    # only the previous row of the dynamic programming matrix is kept
+    previous = [0] * (1 + len(string2))
     longest, x_longest = 0, 0
     for x in range(1, 1 + len(string1)):
+        current = [0] * (1 + len(string2))
+        letter = string1[x - 1]
         for y in range(1, 1 + len(string2)):
-            if string1[x - 1] == string2[y - 1]:
-                m[x][y] = m[x - 1][y - 1] + 1
-                if m[x][y] > longest:
-                    longest = m[x][y]
+            if letter == string2[y - 1]:
+                current[y] = previous[y - 1] + 1
+                if current[y] > longest:
+                    longest = current[y]
                     x_longest = x
-            else:
-                m[x][y] = 0
+        previous = current
     return string1[x_longest - longest: x_longest]
 
+def extract_rule(word, lemma):
+    """  Function that returns the transformation rule that turns a word into its lemma
+
+        :param word: a word
+        :type word: str
+        :param lemma: the lemma of the word
+        :type lemma: str
+        :returns: rule with the form 'suffix>replacement'
+        :rtype: str
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> chana.lemmatizer.extract_rule('perritos','perro')
+        'itos>o'
+        
+    """
+    sub_string = longest_common_substring(word,lemma)
+    left = word.replace(sub_string, "")
+    right = lemma.replace(sub_string, "")
+    return left+">"+right
+
+def read_pairs(pairs):
+    """  Function that yields the (word, lemma) pairs of an iterable, lines of a file are split
+    on whitespace and empty lines are skipped
+
+        :param pairs: tuples of (word, lemma) or lines with a word and its lemma
+        :type pairs: iterable
+        :returns: generator of (word, lemma) tuples
+        :rtype: generator
+        
+    """
+    for pair in pairs:
+        if isinstance(pair, str):
+            pair = pair.split()
+            if not pair:
+                continue
+        yield pair[0], pair[1]
+
+
+class SuffixIndex:
+    """
+    Reversed-character trie over a list of suffixes, checking a word costs O(len(word))
+    no matter how many suffixes are indexed
+    """
+
+    def __init__(self, suffixes):
+        """
+        Constructor of the class that indexes a list of suffixes
+
+        :param suffixes: list of suffixes to be indexed
+        :type suffixes: list
+        """
+        self.suffixes = list(suffixes)
+        self.root = {}
+        for suffix in self.suffixes:
+            self.add(suffix)
+
+    def add(self, suffix):
+        """ Method that adds a suffix to the trie
+
+        :param suffix: the suffix to be added
+        :type suffix: str
+        :returns: none
+        :rtype: None
+        """
+        node = self.root
+        for letter in reversed(suffix):
+            node = node.setdefault(letter, {})
+        # '' can never be a letter of a word, so it marks the end of a suffix
+        node[''] = suffix
+
+    def matches(self, word):
+        """ Method that returns all the indexed suffixes that end a word
+
+        :param word: word to evaluate
+        :type word: str
+        :returns: list of the suffixes found, from the shortest to the longest
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> index = chana.lemmatizer.SuffixIndex(['ra', 'nra', 'ko'])
+        >>> index.matches('pianra')
+        ['ra', 'nra']
+
+    """
+        found = []
+        node = self.root
+        if '' in node:
+            found.append(node[''])
+        for letter in reversed(word):
+            node = node.get(letter)
+            if node is None:
+                break
+            if '' in node:
+                found.append(node[''])
+        return found
+
+
+_shipibo_suffix_index = None
+
+def shipibo_suffix_index():
+    """  Function that returns the index of the shipibo suffixes, it is built only once
+
+        :returns: index with all the shipibo suffixes
+        :rtype: SuffixIndex
+        
+    """
+    global _shipibo_suffix_index
+    if _shipibo_suffix_index is None:
+        my_path = os.path.abspath(os.path.dirname(__file__))
+        path = os.path.join(my_path, "files/lemmatizer/shipibo_suffixes.dat")
+        with codecs.open(path, "r", "utf-8") as suffixes:
+            lines = suffixes.read().splitlines()
+        _shipibo_suffix_index = SuffixIndex(lines)
+    return _shipibo_suffix_index
+
 def has_shipibo_suffix(str):
     """  Function that returns the possible existence of a shipo suffix in a a word
 
@@ -79,15 +204,24 @@ def has_shipibo_suffix(str):
         True
         
     """
-    my_path = os.path.abspath(os.path.dirname(__file__))
-    path = os.path.join(my_path, "files/lemmatizer/shipibo_suffixes.dat")
-    suffixes = codecs.open(path, "r", "utf-8")
-    lines = suffixes.read().splitlines()
-    lines = tuple(lines)
-    if str.endswith(lines):
-        return True
-    else:
-        return False
+    return len(shipibo_suffix_index().matches(str)) > 0
+
+def shipibo_suffix_matches(word):
+    """  Function that returns all the shipibo suffixes found at the end of a word
+
+        :param word: word to evaluate
+        :type word: str
+        :returns: list of the suffixes found, from the shortest to the longest
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> chana.lemmatizer.shipibo_suffix_matches('pianra')
+        ['a', 'ra']
+        
+    """
+    return shipibo_suffix_index().matches(word)
 
 def shipibo_suffixes():
     """  Function that returns a list with all the shipibo suffixes
@@ -102,11 +236,547 @@ def shipibo_suffixes():
         ['naan', 'yama', 'men', 'iosma', ..., 'shoko']
         
     """
-    my_path = os.path.abspath(os.path.dirname(__file__))
-    path = os.path.join(my_path, "files/lemmatizer/shipibo_suffixes.dat")
-    suffixes = codecs.open(path, "r", "utf-8")
-    shipibo_suffixes = suffixes.read().splitlines()
-    return(shipibo_suffixes)
+    return list(shipibo_suffix_index().suffixes)
+
+
+def parse_rule(rule):
+    """  Function that splits a transformation rule 'suffix>replacement' to be applied by slicing
+
+        :param rule: a rule to transform a word
+        :type rule: str
+        :returns: tuple with the suffix to be removed, its length and the string to be appended
+        :rtype: tuple
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> chana.lemmatizer.parse_rule('anwe>i')
+        ('anwe', 4, 'i')
+        
+    """
+    rule = str(rule).split('>')
+    return (rule[0], len(rule[0]), rule[1])
+
+def rule_table(classes):
+    """  Function that parses all the rules of a classifier, indexed by their position in classes_
+
+        :param classes: the rules known by a classifier
+        :type classes: list
+        :returns: list with the parsed rules
+        :rtype: list
+        
+    """
+    return [parse_rule(rule) for rule in classes]
+
+def words_to_features(words, features_length):
+    """  Function that turns a list of words into a matrix of features for the classifier,
+    each row holds the reversed character codes of a word padded with zeros
+
+        :param words: list of words to be transformed
+        :type words: list
+        :param features_length: number of features per word, longer words are truncated
+        :type features_length: int
+        :returns: matrix of features with one row per word
+        :rtype: numpy.ndarray
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> chana.lemmatizer.words_to_features(['piki', 'kanwe'], 6)
+        array([[105, 107, 105, 112,   0,   0],
+               [101, 119, 110,  97, 107,   0]], dtype=uint32)
+        
+    """
+    padded = ''.join(word[::-1][:features_length].ljust(features_length, '\0') for word in words)
+    features = np.frombuffer(padded.encode('utf-32-le'), dtype='<u4')
+    return features.reshape(len(words), features_length).astype(np.uint32)
+
+def chunks(iterable, chunk_size):
+    """  Function that splits an iterable into lists of at most chunk_size elements
+
+        :param iterable: elements to be split
+        :type iterable: iterable
+        :param chunk_size: maximum size of each chunk
+        :type chunk_size: int
+        :returns: generator of lists
+        :rtype: generator
+        
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class PackedKNeighbors:
+    """
+    Exact k-nearest neighbors classifier over compact integer arrays, an alternative
+    to the KNeighborsClassifier of scikit-learn for the small character features of the lemmatizers.
+    Samples at the same distance are taken in their order, which is not how scikit-learn breaks ties.
+    A classifier built with from_sklearn keeps the scikit-learn model and sends it the words whose
+    prediction depends on the ties, so it predicts the same labels but still needs scikit-learn.
+    A classifier built with fit breaks every tie by the order of its samples and does not use it
+    """
+
+    metrics = ('hamming', 'chebyshev')
+
+    def __init__(self, n_neighbors = 5, metric = 'hamming'):
+        """
+        Constructor of the class with the number of neighbors and the metric to be used
+
+        :param n_neighbors: number of neighbors to be used
+        :type n_neighbors: int
+        :param metric: 'hamming' or 'chebyshev'
+        :type metric: str
+        """
+        if metric not in self.metrics:
+            raise ValueError("metric must be one of %s" % ', '.join(self.metrics))
+        self.n_neighbors = n_neighbors
+        self.metric = metric
+        self.features = None
+        self.labels = None
+        self.classes_ = None
+        self.fallback = None
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """ Method that builds the classifier with the training samples of a fitted KNeighborsClassifier,
+        the model is kept to predict the words whose nearest samples are tied
+
+        :param model: a fitted KNeighborsClassifier with uniform weights
+        :type model: KNeighborsClassifier
+        :returns: the classifier with the same samples, labels, neighbors and predictions
+        :rtype: PackedKNeighbors
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.ShipiboLemmatizer()
+        >>> engine = chana.lemmatizer.PackedKNeighbors.from_sklearn(lemmatizer.lemmatizer)
+        >>> engine.predict(lemmatizer.preprocess_word('pikanwe'))
+        array(['anwe>i'], dtype='<U16')
+
+    """
+        if model.weights != 'uniform':
+            raise ValueError('Only models with uniform weights are supported')
+        engine = cls(model.n_neighbors, model.effective_metric_)
+        engine.fit(model._fit_X, model._y, model.classes_)
+        engine.fallback = model
+        return engine
+
+    def fit(self, features, labels, classes):
+        """ Method that stores the training samples in the smallest unsigned integer type that holds them
+
+        :param features: matrix of features, one row per sample
+        :type features: numpy.ndarray
+        :param labels: position in classes of the label of each sample
+        :type labels: numpy.ndarray
+        :param classes: sorted array with all the labels
+        :type classes: numpy.ndarray
+        :returns: none
+        :rtype: None
+        """
+        features = np.asarray(features)
+        self.features = features.astype(np.min_scalar_type(features.max(initial=0)))
+        # one contiguous row per feature, distances are accumulated a feature at a time
+        self.columns = np.ascontiguousarray(self.features.T)
+        self.labels = np.asarray(labels).astype(np.uint16 if len(classes) < 2**16 else np.uint32)
+        self.classes_ = np.asarray(classes)
+        self.fallback = None
+        self.index_lengths()
+
+    def partial_fit(self, features, labels, classes, relabel = None):
+        """ Method that appends training samples to the ones already stored
+
+        :param features: matrix of features of the new samples
+        :type features: numpy.ndarray
+        :param labels: position in classes of the label of each new sample
+        :type labels: numpy.ndarray
+        :param classes: sorted array with all the labels, old and new
+        :type classes: numpy.ndarray
+        :param relabel: new position in classes of each old label, None if the old positions did not change
+        :type relabel: numpy.ndarray
+        :returns: none
+        :rtype: None
+        """
+        features = np.asarray(features)
+        dtype = np.promote_types(self.features.dtype, np.min_scalar_type(features.max(initial=0)))
+        label_dtype = np.uint16 if len(classes) < 2**16 else np.uint32
+        old_labels = self.labels if relabel is None else np.asarray(relabel)[self.labels]
+        self.features = np.concatenate([self.features.astype(dtype, copy=False), features.astype(dtype)])
+        self.columns = np.ascontiguousarray(self.features.T)
+        self.labels = np.concatenate([old_labels.astype(label_dtype), np.asarray(labels).astype(label_dtype)])
+        self.classes_ = np.asarray(classes)
+        # the samples of the scikit-learn model are not the stored ones anymore
+        self.fallback = None
+        self.index_lengths()
+
+    def index_lengths(self):
+        """ Inner method that groups the training samples by the length of their word, the number of features before the padding
+
+        :returns: none
+        :rtype: None
+        """
+        lengths = (self.features != 0).sum(axis=1)
+        self.groups = {}
+        for length in np.unique(lengths).tolist():
+            positions = np.flatnonzero(lengths == length)
+            # the smallest value of each feature, a bound of the distance to the shorter words
+            self.groups[length] = (positions, self.features[positions].min(axis=0), np.ascontiguousarray(self.columns[:, positions]))
+
+    def distances(self, features, samples = None):
+        """ Method that returns the distances between some words and the training samples
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param samples: positions of the training samples to be compared, all of them if None
+        :type samples: numpy.ndarray
+        :returns: matrix of distances of shape (words, samples)
+        :rtype: numpy.ndarray
+        """
+        return self.compare(features, self.columns if samples is None else self.columns[:, samples])
+
+    def compare(self, features, columns):
+        """ Inner method that returns the distances between some words and the samples of some columns,
+        only the first features of the words are compared if they have fewer than the samples
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param columns: matrix with a row of the values of the samples by feature
+        :type columns: numpy.ndarray
+        :returns: matrix of distances of shape (words, samples)
+        :rtype: numpy.ndarray
+        """
+        features = np.asarray(features)
+        if features.max(initial=0) > np.iinfo(columns.dtype).max:
+            columns = columns.astype(np.uint32)
+        features = features.astype(columns.dtype)
+        if self.metric == 'hamming':
+            distances = np.zeros((features.shape[0], columns.shape[1]), dtype=np.min_scalar_type(len(columns)))
+            for column, values in zip(columns, features.T):
+                distances += column != values[:, None]
+        else:
+            # both values are unsigned, so the absolute difference is the greater minus the smaller
+            distances = np.zeros((features.shape[0], columns.shape[1]), dtype=columns.dtype)
+            for column, values in zip(columns, features.T):
+                np.maximum(distances, np.maximum(column, values[:, None]) - np.minimum(column, values[:, None]), out=distances)
+        return distances
+
+    def search(self, features, find_ties = False):
+        """ Method that returns the nearest training samples of some words and whether they depend on how the ties are broken,
+        ties are broken by the order of the samples. With the chebyshev metric the samples are grouped by the length of their
+        word and the groups that can not hold a neighbor or a tie are skipped, a letter against the padding is already farther
+        than most neighbors. With hamming the lengths do not bound the distances enough and all the samples are compared
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param find_ties: if False the tied words are not searched
+        :type find_ties: bool
+        :returns: matrix of positions of shape (words, n_neighbors) sorted by distance and boolean array of the tied words
+        :rtype: tuple
+        """
+        features = np.asarray(features)
+        if self.metric == 'hamming':
+            distances = self.distances(features)
+            return self.nearest(distances), self.tied(distances, self.labels) if find_ties else None
+        far = max(int(self.features.max(initial=0)), int(features.max(initial=0))) + 1
+        dtype = np.min_scalar_type(far)
+        nearest = np.empty((features.shape[0], self.n_neighbors), dtype=np.int64)
+        tied = np.zeros(features.shape[0], dtype=bool)
+        lengths = (features != 0).sum(axis=1)
+        for length in np.unique(lengths).tolist():
+            rows = np.flatnonzero(lengths == length)
+            block = features[rows]
+            # a sample of another length differs from the word in every feature between both lengths
+            bounds = []
+            for other, (positions, smallest, columns) in self.groups.items():
+                if other == length:
+                    bound = np.zeros(len(rows), dtype=np.int64)
+                elif other < length:
+                    bound = block[:, other:length].max(axis=1).astype(np.int64)
+                else:
+                    bound = np.full(len(rows), int(smallest[length:other].max()), dtype=np.int64)
+                bounds.append((int(bound.min()), other, positions, columns, bound))
+            bounds.sort(key=lambda item: item[:2])
+            # the samples of the closest lengths give a distance that the nearest neighbors can not exceed
+            reach = np.full(len(rows), far, dtype=np.int64)
+            searched = []
+            size = 0
+            for lowest, other, positions, columns, bound in bounds:
+                pending = np.flatnonzero(bound <= reach) if size >= self.n_neighbors else np.arange(len(rows))
+                if len(pending) == 0:
+                    continue
+                # the features after both lengths are padding in the word and in the samples
+                searched.append((positions, pending, self.compare(block[pending, :max(length, other)], columns)))
+                size += len(positions)
+                if size >= self.n_neighbors and size - len(positions) < self.n_neighbors:
+                    # later samples can only bring the last neighbor closer, so this bound stays valid
+                    distances = self.gather(searched, len(rows), far, dtype)[1]
+                    reach = np.partition(distances, self.n_neighbors - 1, axis=1)[:, self.n_neighbors - 1].astype(np.int64)
+            columns, distances = self.gather(searched, len(rows), far, dtype)
+            nearest[rows] = columns[self.nearest(distances)]
+            if find_ties:
+                tied[rows] = self.tied(distances, self.labels[columns])
+        return nearest, tied if find_ties else None
+
+    def gather(self, searched, rows, far, dtype):
+        """ Inner method that joins the distances computed for some groups of samples in one matrix with the samples in their order
+
+        :param searched: (positions of the samples, rows of the words, distances) of each group
+        :type searched: list
+        :param rows: number of words
+        :type rows: int
+        :param far: distance of the samples that were not compared with a word
+        :type far: int
+        :param dtype: type of the distances
+        :type dtype: numpy.dtype
+        :returns: positions of the samples and matrix of distances of shape (words, samples)
+        :rtype: tuple
+        """
+        columns = np.concatenate([positions for positions, pending, values in searched])
+        distances = np.full((rows, len(columns)), far, dtype=dtype)
+        start = 0
+        for positions, pending, values in searched:
+            distances[pending, start:start + len(positions)] = values
+            start += len(positions)
+        order = np.argsort(columns, kind='stable')
+        return columns[order], distances[:, order]
+
+    def kneighbors(self, features, samples = None):
+        """ Method that returns the positions of the nearest training samples of some words,
+        ties are broken by the order of the samples
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param samples: sorted positions of the training samples to be searched, all of them if None
+        :type samples: numpy.ndarray
+        :returns: matrix of positions of shape (words, n_neighbors) sorted by distance
+        :rtype: numpy.ndarray
+        """
+        if samples is None:
+            return self.search(features)[0]
+        return samples[self.nearest(self.distances(features, samples))]
+
+    def nearest(self, distances):
+        """ Inner method that returns the columns of the smallest distances of each row, ties are broken by the order of the columns
+
+        :param distances: matrix of distances of shape (words, samples)
+        :type distances: numpy.ndarray
+        :returns: matrix of columns of shape (words, n_neighbors) sorted by distance
+        :rtype: numpy.ndarray
+        """
+        if self.n_neighbors == 1:
+            nearest = np.argmin(distances, axis=1)[:, None]
+        else:
+            keys = distances.astype(np.int64) * distances.shape[1] + np.arange(distances.shape[1])
+            nearest = np.argpartition(keys, self.n_neighbors - 1, axis=1)[:, :self.n_neighbors]
+            order = np.argsort(np.take_along_axis(keys, nearest, axis=1), axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+        return nearest
+
+    def tied(self, distances, labels):
+        """ Inner method that finds the words whose neighbors depend on how the ties are broken, the samples
+        at the distance of the last neighbor are more than needed and do not all have the same label
+
+        :param distances: matrix of distances of shape (words, samples) with every sample that can be a neighbor
+        :type distances: numpy.ndarray
+        :param labels: label of each sample
+        :type labels: numpy.ndarray
+        :returns: boolean array, True for the words whose prediction may depend on the tie breaking
+        :rtype: numpy.ndarray
+        """
+        if distances.shape[1] <= self.n_neighbors:
+            return np.zeros(distances.shape[0], dtype=bool)
+        last = np.partition(distances, self.n_neighbors - 1, axis=1)[:, self.n_neighbors - 1:self.n_neighbors]
+        at_last = distances == last
+        crowded = (distances < last).sum(axis=1) + at_last.sum(axis=1) > self.n_neighbors
+        lowest = np.where(at_last, labels, np.iinfo(labels.dtype).max).min(axis=1)
+        highest = np.where(at_last, labels, 0).max(axis=1)
+        return crowded & (lowest != highest)
+
+    def vote(self, labels):
+        """ Method that returns the most common label of each row, ties go to the first class
+
+        :param labels: matrix of labels of shape (words, neighbors)
+        :type labels: numpy.ndarray
+        :returns: the winning label of each row
+        :rtype: numpy.ndarray
+        """
+        labels = labels.astype(np.int64)
+        if labels.shape[1] == 1:
+            return labels[:, 0]
+        counts = (labels[:, :, None] == labels[:, None, :]).sum(axis=2)
+        scores = counts * len(self.classes_) - labels
+        return np.take_along_axis(labels, np.argmax(scores, axis=1)[:, None], axis=1)[:, 0]
+
+    def predict_ids(self, features, chunk_size = 1024):
+        """ Method that returns the position in classes_ of the predicted label of some words
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param chunk_size: maximum number of words searched at once
+        :type chunk_size: int
+        :returns: array with the position of the label of each word
+        :rtype: numpy.ndarray
+        """
+        features = np.asarray(features).reshape(-1, self.features.shape[1])
+        ids = np.empty(features.shape[0], dtype=np.int64)
+        for start in range(0, features.shape[0], chunk_size):
+            chunk = features[start:start + chunk_size]
+            nearest, tied = self.search(chunk, self.fallback is not None)
+            ids[start:start + chunk_size] = self.vote(self.labels[nearest])
+            if self.fallback is not None:
+                # scikit-learn breaks the ties in its own way, only the words that depend on it are sent to the model
+                tied = np.flatnonzero(tied)
+                if len(tied):
+                    ids[start + tied] = np.searchsorted(self.classes_, self.fallback.predict(chunk[tied]))
+        return ids
+
+    def predict(self, features):
+        """ Method that predicts the labels of some words
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :returns: array with the label of each word
+        :rtype: numpy.ndarray
+        """
+        return self.classes_[self.predict_ids(features)]
+
+
+class SuffixTrieKNeighbors(PackedKNeighbors):
+    """
+    Nearest neighbors classifier that only compares a word against the training samples that share its
+    longest ending. The samples are kept sorted by their reversed characters, a flattened suffix trie where
+    the samples of every ending are a range, so the index is one array of positions whatever the number of endings.
+    The search is approximate, a nearer sample with another ending is not seen, so the prediction can
+    differ from the exact search. A larger min_candidates compares more samples from shorter endings and
+    exact_fallback compares the words without enough candidates against all the samples, both make the
+    results differ less often
+    """
+
+    def __init__(self, n_neighbors = 5, metric = 'hamming', min_candidates = None, exact_fallback = False):
+        """
+        Constructor of the class with the number of neighbors, the metric and how to search the endings
+
+        :param n_neighbors: number of neighbors to be used
+        :type n_neighbors: int
+        :param metric: 'hamming' or 'chebyshev'
+        :type metric: str
+        :param min_candidates: minimum number of samples to be compared, n_neighbors if None
+        :type min_candidates: int
+        :param exact_fallback: if True, words with fewer candidates than min_candidates are compared against all the samples, else against the samples of the deepest ending that has enough of them
+        :type exact_fallback: bool
+        """
+        PackedKNeighbors.__init__(self, n_neighbors, metric)
+        self.min_candidates = max(n_neighbors, min_candidates or 0)
+        self.exact_fallback = exact_fallback
+        self.order = None
+
+    def fit(self, features, labels, classes):
+        """ Method that stores the training samples and sorts them by their endings
+
+        :param features: matrix of features, one row per sample
+        :type features: numpy.ndarray
+        :param labels: position in classes of the label of each sample
+        :type labels: numpy.ndarray
+        :param classes: sorted array with all the labels
+        :type classes: numpy.ndarray
+        :returns: none
+        :rtype: None
+        """
+        PackedKNeighbors.fit(self, features, labels, classes)
+        self.sort_endings()
+
+    def partial_fit(self, features, labels, classes, relabel = None):
+        """ Method that appends training samples to the ones already stored and sorts them again
+
+        :param features: matrix of features of the new samples
+        :type features: numpy.ndarray
+        :param labels: position in classes of the label of each new sample
+        :type labels: numpy.ndarray
+        :param classes: sorted array with all the labels, old and new
+        :type classes: numpy.ndarray
+        :param relabel: new position in classes of each old label, None if the old positions did not change
+        :type relabel: numpy.ndarray
+        :returns: none
+        :rtype: None
+        """
+        PackedKNeighbors.partial_fit(self, features, labels, classes, relabel)
+        self.sort_endings()
+
+    def sort_endings(self):
+        """ Inner method that sorts the positions of the samples by their reversed characters, the first one first
+
+        :returns: none
+        :rtype: None
+        """
+        self.order = np.lexsort(self.columns[::-1]).astype(np.uint32)
+        # one contiguous row per feature in the sorted order, to search the range of an ending
+        self.sorted_columns = np.ascontiguousarray(self.columns[:, self.order])
+
+    def ending(self, row):
+        """ Inner method that returns the range of the sorted samples of the longest ending of a word
+        that has enough candidates
+
+        :param row: features of the word
+        :type row: list
+        :returns: (start, end) of the range in the sorted samples, None to compare against all the samples
+        :rtype: tuple
+        """
+        ranges = [(0, len(self.order))]
+        for column, value in zip(self.sorted_columns, row):
+            if value == 0:
+                break
+            # the samples of the range share the previous characters, so this one is sorted inside it
+            start, end = ranges[-1]
+            values = column[start:end]
+            first = start + int(np.searchsorted(values, value, 'left'))
+            last = start + int(np.searchsorted(values, value, 'right'))
+            if first == last:
+                break
+            ranges.append((first, last))
+        if ranges[-1][1] - ranges[-1][0] < self.min_candidates and self.exact_fallback:
+            return None
+        while len(ranges) > 1 and ranges[-1][1] - ranges[-1][0] < self.min_candidates:
+            ranges.pop()
+        return ranges[-1] if len(ranges) > 1 else None
+
+    def candidates(self, row):
+        """ Method that returns the training samples that share the longest ending with a word
+
+        :param row: features of the word
+        :type row: list
+        :returns: sorted positions of the candidate samples, None for all of them
+        :rtype: numpy.ndarray
+        """
+        found = self.ending(row)
+        return None if found is None else np.sort(self.order[found[0]:found[1]])
+
+    def predict_ids(self, features, chunk_size = 256):
+        """ Method that returns the position in classes_ of the predicted label of some words,
+        the words that share the same candidates are compared together
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :param chunk_size: maximum number of words compared at once against all the samples
+        :type chunk_size: int
+        :returns: array with the position of the label of each word
+        :rtype: numpy.ndarray
+        """
+        features = np.asarray(features).reshape(-1, self.features.shape[1])
+        groups = {}
+        for i, row in enumerate(features.tolist()):
+            groups.setdefault(self.ending(row), []).append(i)
+        ids = np.empty(features.shape[0], dtype=np.int64)
+        for found, rows in groups.items():
+            samples = None if found is None else np.sort(self.order[found[0]:found[1]])
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                nearest = self.kneighbors(features[chunk], samples)
+                ids[chunk] = self.vote(self.labels[nearest])
+        return ids
 
 
 class ShipiboLemmatizer:
@@ -114,17 +784,34 @@ class ShipiboLemmatizer:
     Instance of the pre-trained shipibo lemmatizer
     """
 
-    def __init__(self):
+    def __init__(self, backend = 'sklearn', cache_size = 0, persistent_cache = None):
         """
         Constructor of the class that loads the pretrained model
+
+        :param backend: 'sklearn' to predict with the pretrained KNeighborsClassifier or 'numpy' to predict with PackedKNeighbors
+        :type backend: str
+        :param cache_size: maximum number of lemmas to be memoized by word, 0 to disable the cache
+        :type cache_size: int
+        :param persistent_cache: store shared across runs and processes for the lemmas, None to disable it
+        :type persistent_cache: PersistentCache
         """
+        if backend not in ('sklearn', 'numpy'):
+            raise ValueError("backend must be 'sklearn' or 'numpy'")
         my_path = os.path.abspath(os.path.dirname(__file__))
         path = os.path.join(my_path, "files/lemmatizer/shipibo_knn_model.pkl")
         self.lemmatizer = joblib.load(path)
         self.features_length = 18
+        self.backend = backend
+        self.engine = PackedKNeighbors.from_sklearn(self.lemmatizer) if backend == 'numpy' else None
+        self.rules = rule_table(self.lemmatizer.classes_)
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.persistent_cache = persistent_cache
+        # the lemmas depend on the model, this code and the options that change the predictions
+        self.fingerprint = '%s:%s' % (model_fingerprint(path, __file__), backend)
 
     def preprocess_word(self, word):
-        """ Method that turns a word in an array of features for the classifier
+        """ Method that turns a word in an array of features for the classifier, only the last
+        features_length letters of longer words are kept
 
         :param word: a word to be transformed
         :type word: str
@@ -141,7 +828,7 @@ class ShipiboLemmatizer:
     """
         features = [0 for x in range(self.features_length)]
         i = 0
-        pal = reversed(list(word))
+        pal = word[::-1][:self.features_length]
         for letter in pal:
             features[i]=ord(letter)
             i+=1
@@ -176,6 +863,49 @@ class ShipiboLemmatizer:
         else:
             return word    
 
+    def apply_rule(self, rule_id, word):
+        """ Method that returns the lemma of a word given the position of a rule in the rule table,
+        the same as get_lemma without parsing the rule again
+
+        :param rule_id: position of the rule in the classes of the classifier
+        :type rule_id: int
+        :param word: a word to be transformed
+        :type word: str
+        :returns: word transformed
+        :rtype: str
+        """
+        substract, length, add = self.rules[rule_id]
+        if length == 0:
+            return word + add
+        elif word.endswith(substract):
+            return word[:-length] + add
+        else:
+            return word
+
+    def predict_rule_ids(self, features):
+        """ Inner method that predicts the position of the rules of a matrix of features with the selected backend
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :returns: numpy array with the position of the rules in the rule table
+        :rtype: array
+        """
+        if self.engine is not None:
+            return self.engine.predict_ids(features)
+        return np.searchsorted(self.lemmatizer.classes_, self.lemmatizer.predict(features))
+
+    def predict_rules(self, features):
+        """ Inner method that predicts the rules of a matrix of features with the selected backend
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :returns: numpy array with the rules
+        :rtype: array
+        """
+        if self.engine is not None:
+            return self.engine.predict(features)
+        return self.lemmatizer.predict(features)
+
     def get_rule(self, word):
         """ Method that returns the transformation rule for a shipibo word
 
@@ -192,13 +922,12 @@ class ShipiboLemmatizer:
         array(['anwe>i'], dtype='<U16')       
         
     """
-        lemma_num = self.preprocess_word(word)
-        lemma_num = np.array(lemma_num).reshape(1 ,-1)
-        rule = self.lemmatizer.predict(lemma_num)
+        rule = self.predict_rules(words_to_features([word], self.features_length))
         return rule
 
     def lemmatize(self, word):
-        """ Method that predicts the lemma of a shipibo word
+        """ Method that predicts the lemma of a shipibo word, the classifier only sees the last
+        features_length letters of longer words, as in lemmatize_many
 
         :param word: a word to get the lemma
         :type word: str
@@ -213,12 +942,110 @@ class ShipiboLemmatizer:
         'piki'       
         
     """
-        if has_shipibo_suffix(word): 
-            rule = self.get_rule(word)
-            lemma = self.get_lemma(rule, word)
+        lemma = self.cached_lemmas([word])[0]
+        if lemma is not None:
             return lemma
+        if has_shipibo_suffix(word): 
+            rule_id = self.predict_rule_ids(words_to_features([word], self.features_length))[0]
+            lemma = self.apply_rule(rule_id, word)
         else:
-            return word
+            lemma = word
+        self.remember([word], [lemma])
+        return lemma
+
+    def lemmatize_many(self, words, chunk_size=1024):
+        """ Method that predicts the lemmas of a list of shipibo words, the classifier is called
+        once per chunk of words instead of once per word, gives the same lemmas as lemmatize
+
+        :param words: words to get the lemmas
+        :type words: iterable
+        :param chunk_size: maximum number of words to be predicted at once
+        :type chunk_size: int
+        :returns: list with the lemmas of the words
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.ShipiboLemmatizer()
+        >>> lemmatizer.lemmatize_many(['pikanwe', 'shipibo'])
+        ['piki', 'shipibo']       
+        
+    """
+        lemmas = []
+        for chunk in chunks(words, chunk_size):
+            found = self.cached_lemmas(chunk)
+            missing = [i for i, lemma in enumerate(found) if lemma is None]
+            with_suffix = [i for i in missing if has_shipibo_suffix(chunk[i])]
+            if with_suffix:
+                features = words_to_features([chunk[i] for i in with_suffix], self.features_length)
+                rule_ids = self.predict_rule_ids(features)
+                for i, rule_id in zip(with_suffix, rule_ids):
+                    found[i] = self.apply_rule(rule_id, chunk[i])
+            for i in missing:
+                if found[i] is None:
+                    found[i] = chunk[i]
+            self.remember([chunk[i] for i in missing], [found[i] for i in missing])
+            lemmas.extend(found)
+        return lemmas
+
+    def cached_lemmas(self, words):
+        """ Inner method that returns the memoized lemmas of a list of words, from the lemma cache
+        or from the persistent cache
+
+        :param words: list of words
+        :type words: list
+        :returns: list with the lemma of each word or None if it is not memoized
+        :rtype: list
+        """
+        if self.cache is None:
+            found = [None] * len(words)
+        else:
+            found = [self.cache.get(word) for word in words]
+        missing = [i for i, lemma in enumerate(found) if lemma is None]
+        if self.persistent_cache is not None and missing:
+            stored = self.persistent_cache.get_many('lemma', self.fingerprint, [words[i] for i in missing])
+            for i in missing:
+                found[i] = stored.get(words[i])
+                if found[i] is not None and self.cache is not None:
+                    self.cache.put(words[i], found[i])
+        return found
+
+    def remember(self, words, lemmas):
+        """ Inner method that memoizes the lemmas of a list of words in the enabled caches
+
+        :param words: list of words
+        :type words: list
+        :param lemmas: list with the lemma of each word
+        :type lemmas: list
+        :returns: none
+        :rtype: None
+        """
+        if self.cache is not None:
+            for word, lemma in zip(words, lemmas):
+                self.cache.put(word, lemma)
+        if self.persistent_cache is not None and words:
+            self.persistent_cache.put_many('lemma', self.fingerprint, zip(words, lemmas))
+
+    def cache_stats(self):
+        """ Method that returns the statistics of the lemma cache
+
+        :returns: dict with the hits, misses, evictions, current size and maximum size, None if the cache is disabled
+        :rtype: dict
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.ShipiboLemmatizer(cache_size=1000)
+        >>> lemmatizer.lemmatize('pikanwe')
+        'piki'
+        >>> lemmatizer.lemmatize('pikanwe')
+        'piki'
+        >>> lemmatizer.cache_stats()
+        {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1, 'maxsize': 1000}
+
+    """
+        return None if self.cache is None else self.cache.stats()
 
 
 class GeneralLemmatizer:
@@ -226,7 +1053,7 @@ class GeneralLemmatizer:
     Instance of a new lemmatizer to be trained and used
     """
 
-    def __init__(self, features_length = 10, n_neighbors = 5):
+    def __init__(self, features_length = 10, n_neighbors = 5, backend = 'sklearn', min_candidates = None, exact_fallback = False, cache_size = 0):
         """
         Constructor of the class with the number of features to be used by the lemmatizer
 
@@ -234,11 +1061,32 @@ class GeneralLemmatizer:
         :type features_length: int
         :param n_neighbors: number of neighbors to be used
         :type n_neighbors: int
+        :param backend: 'sklearn' to predict with KNeighborsClassifier, 'numpy' to predict with PackedKNeighbors or 'trie' to predict with SuffixTrieKNeighbors
+        :type backend: str
+        :param min_candidates: minimum number of samples to be compared by the 'trie' backend
+        :type min_candidates: int
+        :param exact_fallback: if True, the 'trie' backend compares against all the samples the words with fewer candidates than min_candidates
+        :type exact_fallback: bool
+        :param cache_size: maximum number of lemmas to be memoized by word, 0 to disable the cache
+        :type cache_size: int
 
         """
+        if backend not in ('sklearn', 'numpy', 'trie'):
+            raise ValueError("backend must be 'sklearn', 'numpy' or 'trie'")
         self.features_length = features_length
         self.n_neighbors = n_neighbors
+        self.backend = backend
+        self.min_candidates = min_candidates
+        self.exact_fallback = exact_fallback
         self.lemmatizer = None
+        self.engine = None
+        self.rules = None
+        self.samples = None
+        self.sample_rules = None
+        self.rule_ids = None
+        self.classes = None
+        self.positions = None
+        self.cache = LRUCache(cache_size) if cache_size else None
 
     def train(self, words, lemmas):
         """ Method that trains a new lemmatizer with a list of words and a list of lemmas of the same size
@@ -265,30 +1113,162 @@ class GeneralLemmatizer:
         if len(words) < self.n_neighbors:
             return 'The number of words to train must be greater than the number of neighbors to predict'
 
-        array_clases=[]
-        array_features = [[0 for x in range(self.features_length)] for y in range(len(words))]
-        iterator = 0
+        self.train_pairs(zip(words, lemmas))
+
+    def train_pairs(self, pairs, chunk_size = 10000, n_jobs = 1):
+        """ Method that trains a new lemmatizer with (word, lemma) pairs read a chunk at a time,
+        the features are written into a preallocated uint32 matrix and the rules can be extracted
+        by a pool of processes
+
+        :param pairs: tuples of (word, lemma) or lines of a file with a word and its lemma
+        :type pairs: iterable
+        :param chunk_size: number of pairs to be read at once
+        :type chunk_size: int
+        :param n_jobs: number of processes to extract the rules, 1 to extract them in this process
+        :type n_jobs: int
+        :returns: none
+        :rtype: None
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.GeneralLemmatizer()
+        >>> with open('lemmas.txt', encoding='utf-8') as pairs:
+        ...     lemmatizer.train_pairs(pairs, n_jobs=4)
+        
+    """
+        # the trained model is kept until the new samples are read and found to be enough
+        previous = (self.samples, self.sample_rules, self.rule_ids)
+        self.samples = np.zeros((chunk_size, self.features_length), dtype=np.uint32)
+        self.sample_rules = array.array('I')
+        self.rule_ids = {}
+        try:
+            self.append_pairs(pairs, chunk_size, n_jobs)
+        except BaseException:
+            self.samples, self.sample_rules, self.rule_ids = previous
+            raise
+        if len(self.sample_rules) < self.n_neighbors:
+            self.samples, self.sample_rules, self.rule_ids = previous
+            return 'The number of words to train must be greater than the number of neighbors to predict'
+        self.fit_model()
+
+    def partial_fit(self, words, lemmas, chunk_size = 10000, n_jobs = 1):
+        """ Method that adds more words and lemmas to a trained lemmatizer without training it again,
+        the predictions are the same as training once with all the words
 
-        for word, lemma in zip(words, lemmas):
-            sub_string = longest_common_substring(word,lemma)
-            left = word.replace(sub_string, "")
-            right = lemma.replace(sub_string, "")
-            array_clases.append(left+">"+right)
-            word = reversed(word)
-            let = 0
-            for letter in word:
-                if(let<self.features_length):
-                    array_features[iterator][let] = ord(letter)
-                let += 1
-            iterator += 1
+        :param words: list of words
+        :type words: list
+        :param lemmas: list of lemmas
+        :type lemmas: list
+        :param chunk_size: number of pairs to be read at once
+        :type chunk_size: int
+        :param n_jobs: number of processes to extract the rules, 1 to extract them in this process
+        :type n_jobs: int
+        :returns: none
+        :rtype: None
 
-        model = neighbors.KNeighborsClassifier(n_neighbors=self.n_neighbors, metric='hamming')
-        model.fit(array_features, array_clases)
-        self.lemmatizer = model
+        :Example:
 
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.GeneralLemmatizer()
+        >>> lemmatizer.train(['perritos','gatitos','monotes','perrito','gatito'],['perro','gato','mono','perro','gato'])
+        >>> lemmatizer.partial_fit(['casitas'],['casa'])
+        
+    """
+        if len(words) != len(lemmas):
+            return 'Both arrays must be of the same size'
+        if self.rules == None:
+            return self.train_pairs(zip(words, lemmas), chunk_size, n_jobs)
+
+        start = len(self.sample_rules)
+        old_classes = self.classes
+        self.append_pairs(zip(words, lemmas), chunk_size, n_jobs)
+        self.sort_rules()
+        # the rules keep the order of scikit-learn, new rules move the position of the old ones
+        relabel = None
+        if len(self.classes) != len(old_classes):
+            relabel = np.searchsorted(self.classes, old_classes)
+            for position in np.setdiff1d(np.arange(len(self.classes)), relabel):
+                self.rules.insert(position, parse_rule(self.classes[position]))
+        features = self.samples[:len(self.sample_rules)]
+        labels = self.positions[np.frombuffer(self.sample_rules, dtype=np.uint32)]
+        if self.engine is not None:
+            self.engine.partial_fit(features[start:], labels[start:], self.classes, relabel)
+        else:
+            self.lemmatizer.fit(features, self.classes[labels])
+        if self.cache is not None:
+            self.cache.clear()
+
+    def append_pairs(self, pairs, chunk_size, n_jobs):
+        """ Inner method that adds the features and rules of (word, lemma) pairs to the training samples
+
+        :param pairs: tuples of (word, lemma) or lines of a file with a word and its lemma
+        :type pairs: iterable
+        :param chunk_size: number of pairs to be read at once
+        :type chunk_size: int
+        :param n_jobs: number of processes to extract the rules, 1 to extract them in this process
+        :type n_jobs: int
+        :returns: none
+        :rtype: None
+        """
+        pool = concurrent.futures.ProcessPoolExecutor(n_jobs) if n_jobs > 1 else None
+        try:
+            for chunk in chunks(read_pairs(pairs), chunk_size):
+                words = [word for word, lemma in chunk]
+                lemmas = [lemma for word, lemma in chunk]
+                start = len(self.sample_rules)
+                if start + len(chunk) > self.samples.shape[0]:
+                    grown = np.zeros((2 * (start + len(chunk)), self.features_length), dtype=np.uint32)
+                    grown[:start] = self.samples[:start]
+                    self.samples = grown
+                self.samples[start:start + len(chunk)] = words_to_features(words, self.features_length)
+                if pool is not None:
+                    rules = pool.map(extract_rule, words, lemmas, chunksize=max(1, len(chunk) // (4 * n_jobs)))
+                else:
+                    rules = map(extract_rule, words, lemmas)
+                for rule in rules:
+                    self.sample_rules.append(self.rule_ids.setdefault(rule, len(self.rule_ids)))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def sort_rules(self):
+        """ Inner method that sorts the rules found like the classes of scikit-learn
+
+        :returns: none
+        :rtype: None
+        """
+        self.classes = np.array(sorted(self.rule_ids))
+        self.positions = np.empty(len(self.rule_ids), dtype=np.uint32)
+        self.positions[[self.rule_ids[rule] for rule in self.classes]] = np.arange(len(self.classes))
+
+    def fit_model(self):
+        """ Inner method that fits the selected backend with the training samples
+
+        :returns: none
+        :rtype: None
+        """
+        self.sort_rules()
+        features = self.samples[:len(self.sample_rules)]
+        labels = self.positions[np.frombuffer(self.sample_rules, dtype=np.uint32)]
+        self.lemmatizer = None
+        self.engine = None
+        if self.backend == 'sklearn':
+            self.lemmatizer = neighbors.KNeighborsClassifier(n_neighbors=self.n_neighbors, metric='hamming')
+            self.lemmatizer.fit(features, self.classes[labels])
+        elif self.backend == 'numpy':
+            self.engine = PackedKNeighbors(self.n_neighbors, 'hamming')
+        else:
+            self.engine = SuffixTrieKNeighbors(self.n_neighbors, 'hamming', self.min_candidates, self.exact_fallback)
+        if self.engine is not None:
+            self.engine.fit(features, labels, self.classes)
+        self.rules = rule_table(self.classes)
+        if self.cache is not None:
+            self.cache.clear()
 
     def preprocess_word(self,word):
-        """ Method that turns a word in an array of features for the classifier according to its features_length
+        """ Method that turns a word in an array of features for the classifier according to its features_length,
+        only the last features_length letters of longer words are kept
 
         :param word: a word to be transformed
         :type word: str
@@ -305,7 +1285,7 @@ class GeneralLemmatizer:
     """
         features = [0 for x in range(self.features_length)]
         i = 0
-        pal = reversed(list(word))
+        pal = word[::-1][:self.features_length]
         for letter in pal:
             features[i]=ord(letter)
             i+=1
@@ -340,6 +1320,49 @@ class GeneralLemmatizer:
         else:
             return word    
 
+    def apply_rule(self, rule_id, word):
+        """ Method that returns the lemma of a word given the position of a rule in the rule table,
+        the same as get_lemma without parsing the rule again
+
+        :param rule_id: position of the rule in the classes of the classifier
+        :type rule_id: int
+        :param word: a word to be transformed
+        :type word: str
+        :returns: word transformed
+        :rtype: str
+        """
+        substract, length, add = self.rules[rule_id]
+        if length == 0:
+            return word + add
+        elif word.endswith(substract):
+            return word[:-length] + add
+        else:
+            return word
+
+    def predict_rule_ids(self, features):
+        """ Inner method that predicts the position of the rules of a matrix of features with the selected backend
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :returns: numpy array with the position of the rules in the rule table
+        :rtype: array
+        """
+        if self.engine is not None:
+            return self.engine.predict_ids(features)
+        return np.searchsorted(self.lemmatizer.classes_, self.lemmatizer.predict(features))
+
+    def predict_rules(self, features):
+        """ Inner method that predicts the rules of a matrix of features with the selected backend
+
+        :param features: matrix of features, one row per word
+        :type features: numpy.ndarray
+        :returns: numpy array with the rules
+        :rtype: array
+        """
+        if self.engine is not None:
+            return self.engine.predict(features)
+        return self.lemmatizer.predict(features)
+
     def get_rule(self, word):
         """ Method that returns the transformation rule for a word
 
@@ -356,13 +1379,12 @@ class GeneralLemmatizer:
         array(['ito>0'], dtype='<U16')       
         
     """
-        lemma_num = self.preprocess_word(word)
-        lemma_num = np.array(lemma_num).reshape(1 ,-1)
-        rule = self.lemmatizer.predict(lemma_num)
+        rule = self.predict_rules(words_to_features([word], self.features_length))
         return rule
 
     def lemmatize(self, word):
-        """ Method that predicts the lemma of a word with the trained model
+        """ Method that predicts the lemma of a word with the trained model, the classifier only sees
+        the last features_length letters of longer words, as in lemmatize_many
 
         :param word: a word to get the lemma
         :type word: str
@@ -377,9 +1399,81 @@ class GeneralLemmatizer:
         'perro'       
         
     """
-        if self.lemmatizer == None:
+        if self.rules == None:
         	return 'The lemmatizer must be trained first'
-        rule = self.get_rule(word)
-        lemma = self.get_lemma(rule, word)
+        if self.cache is not None:
+            lemma = self.cache.get(word)
+            if lemma is not None:
+                return lemma
+        features = words_to_features([word], self.features_length)
+        lemma = self.apply_rule(self.predict_rule_ids(features)[0], word)
+        if self.cache is not None:
+            self.cache.put(word, lemma)
         return lemma
 
+    def lemmatize_many(self, words, chunk_size=1024):
+        """ Method that predicts the lemmas of a list of words with the trained model, the classifier
+        is called once per chunk of words instead of once per word, gives the same lemmas as lemmatize
+
+        :param words: words to get the lemmas
+        :type words: iterable
+        :param chunk_size: maximum number of words to be predicted at once
+        :type chunk_size: int
+        :returns: list with the lemmas of the words
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.GeneralLemmatizer()
+        >>> lemmatizer.lemmatize_many(['perrito', 'gatitos'])
+        ['perro', 'gato']       
+        
+    """
+        if self.rules == None:
+            return 'The lemmatizer must be trained first'
+        lemmas = []
+        for chunk in chunks(words, chunk_size):
+            found = self.cached_lemmas(chunk)
+            missing = [i for i, lemma in enumerate(found) if lemma is None]
+            if missing:
+                rule_ids = self.predict_rule_ids(words_to_features([chunk[i] for i in missing], self.features_length))
+                for i, rule_id in zip(missing, rule_ids):
+                    found[i] = self.apply_rule(rule_id, chunk[i])
+                    if self.cache is not None:
+                        self.cache.put(chunk[i], found[i])
+            lemmas.extend(found)
+        return lemmas
+
+    def cached_lemmas(self, words):
+        """ Inner method that returns the memoized lemmas of a list of words
+
+        :param words: list of words
+        :type words: list
+        :returns: list with the lemma of each word or None if it is not memoized
+        :rtype: list
+        """
+        if self.cache is None:
+            return [None] * len(words)
+        return [self.cache.get(word) for word in words]
+
+    def cache_stats(self):
+        """ Method that returns the statistics of the lemma cache
+
+        :returns: dict with the hits, misses, evictions, current size and maximum size, None if the cache is disabled
+        :rtype: dict
+
+        :Example:
+
+        >>> import chana.lemmatizer
+        >>> lemmatizer = chana.lemmatizer.GeneralLemmatizer(cache_size=1000)
+        >>> lemmatizer.train(['perritos','gatitos','monotes','perrito','gatito'],['perro','gato','mono','perro','gato'])
+        >>> lemmatizer.lemmatize('perrito')
+        'perro'
+        >>> lemmatizer.lemmatize('perrito')
+        'perro'
+        >>> lemmatizer.cache_stats()
+        {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1, 'maxsize': 1000}
+
+    """
+        return None if self.cache is None else self.cache.stats()
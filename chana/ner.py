@@ -5,11 +5,20 @@ Source model is from the Chana project and use predefined rules for the language
 """
 import codecs
 import collections
+import concurrent.futures
+import hashlib
+import mmap
 import re
 import os
 import string
+import struct
+import sys
+import threading
+import warnings
+from array import array
 import numpy as np
 import pycrfsuite
+from .cache import LRUCache, model_fingerprint
 
 
 def load_array(file,array):
@@ -35,6 +44,832 @@ def load_array(file,array):
     for key, elem in array.items():
         array[key]='|'.join(elem)
 
+LOCATION_SUFFIXES = re.compile('ain|nko|ainko|mea|meax|nkonia|nkoniax|kea|keax|ainoa|ainoax|oa|oax')
+UPPER_LETTER = re.compile('[ÑA-Z]')
+NUMBERS = frozenset(['westiora','rabé','kimisha','chosko','pichika','sokota','kanchis','posaka','iskon','chonka','pacha','waranka'])
+MONTHS = frozenset(['enero','febrero','marzo','abril','mayo','junio','julio','agosto','setiembre','octubre','noviembre','diciembre'])
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+def load_gazetteer(file):
+    """
+    Inner function that returns the compiled patterns by first letter of a gazetteer file,
+    they are built once per process and shared by all the threads
+
+    :param file: a file to be loaded
+    :type file: str
+    :returns: dict with the compiled pattern of each first letter
+    :rtype: dict
+    """
+    patterns = _gazetteers.get(file)
+    if patterns is None:
+        with _gazetteers_lock:
+            patterns = _gazetteers.get(file)
+            if patterns is None:
+                entries = dict.fromkeys(string.ascii_uppercase + 'Ñ', [])
+                load_array(file, entries)
+                compiled = {}
+                patterns = {}
+                for letter, alternation in entries.items():
+                    if alternation not in compiled:
+                        compiled[alternation] = re.compile(alternation)
+                    patterns[letter] = compiled[alternation]
+                _gazetteers[file] = patterns
+    return patterns
+
+PERSON = 1
+ORGANIZATION = 2
+LOCATION = 4
+
+
+class GazetteerMatcher:
+    """
+    Aho-Corasick automaton over the entries of several gazetteers that finds in a single scan
+    which entity types have an entry contained in a word
+    """
+
+    def __init__(self, literal = False):
+        """
+        Constructor of the class with an empty automaton
+
+        :param literal: if True, a '.' in an entry only matches itself instead of any character
+        :type literal: bool
+        """
+        self.literal = literal
+        self.goto = [{}]
+        self.fail = [0]
+        self.terminal = [0]
+        self.output = [0]
+        self.wildcards = {}
+        self.patterns = {}
+        self.added = []
+        self.built = True
+
+    def add(self, entry, entity_type):
+        """ Method that adds an entry of an entity type to the automaton
+
+        :param entry: text of the entry, a '.' matches any character as in the gazetteer patterns unless the automaton is literal
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        self.added.append((entry, entity_type))
+        if '.' in entry and not self.literal:
+            # the gazetteers are regular expressions, the few entries with a wildcard are matched by one pattern per type
+            self.wildcards.setdefault(entity_type, []).append(entry)
+        else:
+            state = 0
+            for char in entry:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(0)
+                    self.output.append(0)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.terminal[state] |= entity_type
+        self.built = False
+
+    def remove(self, entry, entity_type):
+        """ Method that removes an entry of an entity type from the automaton, its states are kept
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        if (entry, entity_type) not in self.added:
+            return
+        self.added = [added for added in self.added if added != (entry, entity_type)]
+        if '.' in entry and not self.literal:
+            self.wildcards[entity_type] = [wildcard for wildcard in self.wildcards[entity_type] if wildcard != entry]
+            if not self.wildcards[entity_type]:
+                del self.wildcards[entity_type]
+        else:
+            state = 0
+            for char in entry:
+                state = self.goto[state][char]
+            self.terminal[state] &= ~entity_type
+        self.built = False
+
+    def load(self, file, entity_type):
+        """ Method that adds all the entries of a gazetteer file
+
+        :param file: path of the file relative to the package
+        :type file: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        my_path = os.path.abspath(os.path.dirname(__file__))
+        with codecs.open(os.path.join(my_path, file), "r", encoding= "utf-8") as f:
+            for entry in f.read().splitlines():
+                self.add(entry, entity_type)
+
+    def build(self):
+        """ Method that computes the failure links and the types reachable from each state,
+        the new tables replace the old ones only when they are complete
+
+        :returns: none
+        :rtype: None
+        """
+        output = list(self.terminal)
+        fail = [0] * len(self.goto)
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                link = fail[state]
+                while link and char not in self.goto[link]:
+                    link = fail[link]
+                fail[next_state] = self.goto[link].get(char, 0)
+                output[next_state] |= output[fail[next_state]]
+                queue.append(next_state)
+        self.fail = fail
+        self.output = output
+        self.patterns = {entity_type: re.compile('|'.join(entries)) for entity_type, entries in self.wildcards.items()}
+        self.built = True
+
+    def match(self, word):
+        """ Method that returns the entity types with an entry contained in a word
+
+        :param word: a word to be evaluated
+        :type word: str
+        :returns: bitmask of PERSON, ORGANIZATION and LOCATION
+        :rtype: int
+
+        :Example:
+
+        >>> import chana.ner
+        >>> matcher = chana.ner.GazetteerMatcher()
+        >>> matcher.add('Lima', chana.ner.LOCATION)
+        >>> matcher.match('Limanko') == chana.ner.LOCATION
+        True
+
+    """
+        if not self.built:
+            self.build()
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        types = 0
+        for char in word:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            types |= output[state]
+        for entity_type, pattern in self.patterns.items():
+            if not types & entity_type and pattern.search(word):
+                types |= entity_type
+        return types
+
+    def entries(self):
+        """ Method that returns the entries added to the automaton
+
+        :returns: list of (entry, entity type)
+        :rtype: list
+        """
+        return list(self.added)
+
+    def save(self, path, fingerprint = ''):
+        """ Method that writes the automaton to a binary file that can be memory-mapped by CompiledGazetteer
+
+        The file has a header followed by little-endian uint32 arrays: the first edge of each state,
+        the character and next state of each edge sorted by character, the failure link and the types
+        of each state, and then the entries as utf-8 'type\tentry' lines
+
+        :param path: path of the file to be written
+        :type path: str
+        :param fingerprint: fingerprint of the gazetteer files the automaton was built from
+        :type fingerprint: str
+        :returns: none
+        :rtype: None
+        """
+        if not self.built:
+            self.build()
+        edge_start = array('I', [0])
+        edge_char = array('I')
+        edge_next = array('I')
+        for goto in self.goto:
+            for char in sorted(goto):
+                edge_char.append(ord(char))
+                edge_next.append(goto[char])
+            edge_start.append(len(edge_char))
+        text = ''.join('%d\t%s\n' % (entity_type, entry) for entry, entity_type in self.added).encode('utf-8')
+        arrays = [edge_start, edge_char, edge_next, array('I', self.fail), array('I', self.output)]
+        if sys.byteorder != 'little':
+            for values in arrays:
+                values.byteswap()
+        with open(path, 'wb') as f:
+            f.write(GAZETTEER_HEADER.pack(GAZETTEER_MAGIC, len(self.goto), len(edge_char), len(text),
+                                          fingerprint.encode('ascii')))
+            for values in arrays:
+                values.tofile(f)
+            f.write(text)
+
+
+GAZETTEER_MAGIC = b'CHANAGZ1'
+GAZETTEER_HEADER = struct.Struct('<8sIII40s')
+GAZETTEER_FILES = [('files/ner/per_esp_s.dat', PERSON), ('files/ner/loc_esp_s.dat', LOCATION),
+                   ('files/ner/org_esp_s.dat', ORGANIZATION)]
+COMPILED_GAZETTEER = 'files/ner/gazetteers.bin'
+
+
+class CompiledGazetteer:
+    """
+    Read-only gazetteer automaton memory-mapped from a file written by GazetteerMatcher.save,
+    the processes that open the same file share its pages
+    """
+
+    def __init__(self, path):
+        """
+        Constructor of the class that maps the file
+
+        :param path: path of the compiled gazetteer
+        :type path: str
+        """
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, states, edges, text, fingerprint = GAZETTEER_HEADER.unpack_from(self.map)
+        if magic != GAZETTEER_MAGIC:
+            raise ValueError('%s is not a compiled gazetteer' % path)
+        self.fingerprint = fingerprint.decode('ascii').rstrip('\0')
+        views = []
+        offset = GAZETTEER_HEADER.size
+        for length in (states + 1, edges, edges, states, states):
+            views.append(memoryview(self.map)[offset:offset + 4 * length].cast('I'))
+            offset += 4 * length
+        if sys.byteorder != 'little':
+            views = [array('I', view) for view in views]
+            for values in views:
+                values.byteswap()
+        self.edge_start, self.edge_char, self.edge_next, self.fail, self.output = views
+        self.text = (offset, offset + text)
+        # the edges of the states that are visited are copied to dicts, the rest of the automaton stays in the shared pages
+        self.goto = {}
+        self.patterns = {}
+        for entry, entity_type in self.entries():
+            if '.' in entry:
+                self.patterns.setdefault(entity_type, []).append(entry)
+        self.patterns = {entity_type: re.compile('|'.join(entries)) for entity_type, entries in self.patterns.items()}
+
+    def edges(self, state):
+        """
+        Inner method that returns the edges of a state
+
+        :param state: a state of the automaton
+        :type state: int
+        :returns: dict with the next state of each character
+        :rtype: dict
+        """
+        edges = self.goto.get(state)
+        if edges is None:
+            edges = {chr(self.edge_char[edge]): self.edge_next[edge]
+                     for edge in range(self.edge_start[state], self.edge_start[state + 1])}
+            self.goto[state] = edges
+        return edges
+
+    def match(self, word):
+        """ Method that returns the entity types with an entry contained in a word
+
+        :param word: a word to be evaluated
+        :type word: str
+        :returns: bitmask of PERSON, ORGANIZATION and LOCATION
+        :rtype: int
+        """
+        fail = self.fail
+        output = self.output
+        goto = self.goto
+        edges = self.edges
+        state = 0
+        types = 0
+        for char in word:
+            while state and char not in (goto.get(state) or edges(state)):
+                state = fail[state]
+            state = (goto.get(state) or edges(state)).get(char, 0)
+            types |= output[state]
+        for entity_type, pattern in self.patterns.items():
+            if not types & entity_type and pattern.search(word):
+                types |= entity_type
+        return types
+
+    def entries(self):
+        """ Method that returns the entries the automaton was built from
+
+        :returns: list of (entry, entity type)
+        :rtype: list
+        """
+        start, end = self.text
+        entries = []
+        for line in self.map[start:end].decode('utf-8').splitlines():
+            entity_type, entry = line.split('\t', 1)
+            entries.append((entry, int(entity_type)))
+        return entries
+
+
+def gazetteers_fingerprint():
+    """
+    Function that returns the fingerprint of the gazetteer files
+
+    :returns: hexadecimal sha1 of the files
+    :rtype: str
+    """
+    my_path = os.path.abspath(os.path.dirname(__file__))
+    return model_fingerprint(*[os.path.join(my_path, file) for file, entity_type in GAZETTEER_FILES])
+
+def compile_gazetteers(path = None):
+    """
+    Function that compiles the gazetteer files into the binary file loaded by ShipiboNER,
+    it must be run again when the files change
+
+    :param path: path of the compiled gazetteer, by default the one of the package
+    :type path: str
+    :returns: the path of the compiled gazetteer
+    :rtype: str
+
+    :Example:
+
+    >>> import chana.ner
+    >>> chana.ner.compile_gazetteers('gazetteers.bin')
+    'gazetteers.bin'
+
+    """
+    if path is None:
+        path = os.path.join(os.path.abspath(os.path.dirname(__file__)), COMPILED_GAZETTEER)
+    matcher = GazetteerMatcher()
+    for file, entity_type in GAZETTEER_FILES:
+        matcher.load(file, entity_type)
+    matcher.save(path, gazetteers_fingerprint())
+    return path
+
+def open_gazetteers(path = None):
+    """
+    Function that maps the compiled gazetteer, or builds the automaton from the gazetteer files
+    if it is missing or was compiled from other files
+
+    :param path: path of the compiled gazetteer, by default the one of the package
+    :type path: str
+    :returns: the gazetteer automaton
+    :rtype: CompiledGazetteer or GazetteerMatcher
+    """
+    if path is None:
+        path = os.path.join(os.path.abspath(os.path.dirname(__file__)), COMPILED_GAZETTEER)
+    if os.path.exists(path):
+        compiled = CompiledGazetteer(path)
+        if compiled.fingerprint == gazetteers_fingerprint():
+            return compiled
+        warnings.warn('%s is outdated, run chana.ner.compile_gazetteers() to rebuild it' % path)
+    matcher = GazetteerMatcher()
+    for file, entity_type in GAZETTEER_FILES:
+        matcher.load(file, entity_type)
+    matcher.build()
+    return matcher
+
+
+class LayeredGazetteer:
+    """
+    Gazetteer automaton with a layer of entries added and removed at runtime on top of a read-only one,
+    a change only updates the small automata of the layer and rebuilds them at once, so that matching
+    never builds them and can be shared by threads. The added entries are literal text, a '.' in them
+    is not a wildcard as in the bundled patterns
+    """
+
+    def __init__(self, base):
+        """
+        Constructor of the class without changes
+
+        :param base: the bundled gazetteer automaton
+        :type base: CompiledGazetteer or GazetteerMatcher
+        """
+        self.base = base
+        self.added = GazetteerMatcher(literal=True)
+        self.removed = GazetteerMatcher()
+        self.base_entries = []
+        self.base_types = None
+        self.remaining = {}
+        self.patterns = {}
+        self.longest = 0
+
+    def index_base(self):
+        """
+        Inner method that indexes the entries of the bundled automaton, it is done on the first change
+
+        :returns: none
+        :rtype: None
+        """
+        if self.base_types is None:
+            self.base_entries = self.base.entries()
+            self.base_types = {}
+            for entry, entity_type in self.base_entries:
+                self.base_types[entry] = self.base_types.get(entry, 0) | entity_type
+            self.remaining = dict(self.base_types)
+            self.longest = max([len(entry) for entry in self.base_types] + [0])
+
+    def add(self, entry, entity_type):
+        """ Method that adds an entry of an entity type, or restores it if it was a removed bundled entry
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        self.index_base()
+        if self.base_types.get(entry, 0) & entity_type:
+            self.removed.remove(entry, entity_type)
+            self.remaining[entry] |= entity_type
+            self.compile_wildcards()
+            self.removed.build()
+        elif (entry, entity_type) not in self.added.added:
+            self.added.add(entry, entity_type)
+            self.added.build()
+
+    def remove(self, entry, entity_type):
+        """ Method that removes an entry of an entity type, added at runtime or bundled
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        self.index_base()
+        self.added.remove(entry, entity_type)
+        if self.remaining.get(entry, 0) & entity_type:
+            self.removed.add(entry, entity_type)
+            self.remaining[entry] &= ~entity_type
+            self.compile_wildcards()
+        for matcher in (self.added, self.removed):
+            if not matcher.built:
+                matcher.build()
+
+    def compile_wildcards(self):
+        """
+        Inner method that compiles the patterns of the bundled entries with a wildcard that were not removed
+
+        :returns: none
+        :rtype: None
+        """
+        wildcards = {}
+        for entry, types in self.remaining.items():
+            if '.' in entry:
+                for entity_type in ENTITY_NAMES:
+                    if types & entity_type:
+                        wildcards.setdefault(entity_type, []).append(entry)
+        self.patterns = {entity_type: re.compile('|'.join(entries)) for entity_type, entries in wildcards.items()}
+
+    def recheck(self, word):
+        """
+        Inner method that returns the entity types of the bundled entries that were not removed and are contained in a word
+
+        :param word: a word to be evaluated
+        :type word: str
+        :returns: bitmask of PERSON, ORGANIZATION and LOCATION
+        :rtype: int
+        """
+        types = 0
+        remaining = self.remaining
+        for start in range(len(word)):
+            for end in range(start + 1, min(len(word), start + self.longest) + 1):
+                types |= remaining.get(word[start:end], 0)
+        for entity_type, pattern in self.patterns.items():
+            if not types & entity_type and pattern.search(word):
+                types |= entity_type
+        return types
+
+    def match(self, word):
+        """ Method that returns the entity types with an entry contained in a word
+
+        :param word: a word to be evaluated
+        :type word: str
+        :returns: bitmask of PERSON, ORGANIZATION and LOCATION
+        :rtype: int
+        """
+        types = self.base.match(word)
+        if self.removed.added:
+            # only the words that contain a removed entry are checked against the remaining ones
+            suppressed = types & self.removed.match(word)
+            if suppressed:
+                types = types & ~suppressed | self.recheck(word) & suppressed
+        if self.added.added:
+            types |= self.added.match(word)
+        return types
+
+    def entries(self):
+        """ Method that returns the bundled entries that were not removed and the added ones
+
+        :returns: list of (entry, entity type)
+        :rtype: list
+        """
+        if self.base_types is None:
+            return self.base.entries()
+        removed = set(self.removed.entries())
+        return [added for added in self.base_entries if added not in removed] + self.added.entries()
+
+
+ENTITY_NAMES = collections.OrderedDict([(LOCATION, 'LOC'), (ORGANIZATION, 'ORG'), (PERSON, 'PER')])
+ENTITY_TYPES = {name: entity_type for entity_type, name in ENTITY_NAMES.items()}
+
+def normalize_token(token):
+    """
+    Inner function that returns the form of a token used to match the gazetteer entries
+
+    :param token: a token to be normalized
+    :type token: str
+    :returns: the normalized token
+    :rtype: str
+    """
+    return token.lower()
+
+
+class TokenGazetteer:
+    """
+    Trie over the tokens of the gazetteer entries that finds the longest entries of one or more
+    tokens in a sentence, scanning it from left to right
+    """
+
+    def __init__(self):
+        """
+        Constructor of the class with an empty trie
+        """
+        self.root = {}
+        self.max_tokens = 0
+
+    def add(self, entry, entity_type):
+        """ Method that adds an entry of an entity type, its tokens are separated by whitespace
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        tokens = [normalize_token(token) for token in entry.split()]
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        # the '' key cannot be a token and keeps the types of the entries ending in the node
+        node[''] = node.get('', 0) | entity_type
+        self.max_tokens = max(self.max_tokens, len(tokens))
+
+    def remove(self, entry, entity_type):
+        """ Method that removes an entry of an entity type
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        node = self.root
+        for token in entry.split():
+            node = node.get(normalize_token(token))
+            if node is None:
+                return
+        if '' in node:
+            node[''] &= ~entity_type
+            if not node['']:
+                del node['']
+
+    def load(self, file, entity_type):
+        """ Method that adds all the entries of a gazetteer file, one per line
+
+        :param file: path of the file relative to the package
+        :type file: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        my_path = os.path.abspath(os.path.dirname(__file__))
+        with codecs.open(os.path.join(my_path, file), "r", encoding= "utf-8") as f:
+            for entry in f.read().splitlines():
+                self.add(entry, entity_type)
+
+    def spans(self, words):
+        """ Method that returns the longest gazetteer entries found in a list of words, without overlaps
+
+        :param words: a list of words to be evaluated
+        :type words: list
+        :returns: list of (start, end, type) with the words[start:end] of each entry and 'PER', 'ORG' or 'LOC'
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.ner
+        >>> gazetteer = chana.ner.TokenGazetteer()
+        >>> gazetteer.add('Nueva York', chana.ner.LOCATION)
+        >>> gazetteer.spans('Nokon papa Nueva York nko ka'.split())
+        [(2, 4, 'LOC')]
+
+    """
+        tokens = [normalize_token(word) for word in words]
+        spans = []
+        start = 0
+        # each start walks at most max_tokens nodes, so the scan is linear in the number of words
+        while start < len(tokens):
+            node = self.root
+            end = None
+            types = 0
+            for position in range(start, len(tokens)):
+                node = node.get(tokens[position])
+                if node is None:
+                    break
+                if '' in node:
+                    end = position + 1
+                    types = node['']
+            if end is None:
+                start += 1
+            else:
+                # an entry present in several gazetteers takes the type that wins in the rule tagger
+                name = next(name for entity_type, name in ENTITY_NAMES.items() if types & entity_type)
+                spans.append((start, end, name))
+                start = end
+        return spans
+
+
+def spans_to_iob(spans, length):
+    """
+    Function that converts entity spans into IOB tags
+
+    :param spans: list of (start, end, type)
+    :type spans: list
+    :param length: number of words of the sentence
+    :type length: int
+    :returns: list with 'B-' and 'I-' tags for the words of the spans and 'O' for the rest
+    :rtype: list
+
+    :Example:
+
+    >>> import chana.ner
+    >>> chana.ner.spans_to_iob([(2, 4, 'LOC')], 5)
+    ['O', 'O', 'B-LOC', 'I-LOC', 'O']
+
+    """
+    tags = ['O'] * length
+    for start, end, name in spans:
+        tags[start] = 'B-' + name
+        for position in range(start + 1, end):
+            tags[position] = 'I-' + name
+    return tags
+
+
+def edit_distance(first, second, limit):
+    """
+    Function that returns the levenshtein distance between two words, or limit + 1 if it is greater than limit
+
+    :param first: a word
+    :type first: str
+    :param second: another word
+    :type second: str
+    :param limit: maximum distance of interest
+    :type limit: int
+    :returns: the distance, at most limit + 1
+    :rtype: int
+
+    :Example:
+
+    >>> import chana.ner
+    >>> chana.ner.edit_distance('pucallpa', 'pukallpa', 2)
+    1
+
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+def deletes(word, distance):
+    """
+    Function that returns the strings obtained by deleting up to some characters of a word, including the word
+
+    :param word: a word
+    :type word: str
+    :param distance: maximum number of deleted characters
+    :type distance: int
+    :returns: set with the strings
+    :rtype: set
+    """
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i+1:] for variant in frontier for i in range(len(variant))}
+        result |= frontier
+    return result
+
+
+class FuzzyGazetteer:
+    """
+    Symmetric delete index over the gazetteer entries that finds the entries within an edit distance
+    of a word without comparing it with all of them
+    """
+
+    def __init__(self, max_distance = 1, min_length = 5):
+        """
+        Constructor of the class with an empty index
+
+        :param max_distance: maximum edit distance between a word and an entry
+        :type max_distance: int
+        :param min_length: minimum length of the entries and words to be compared, shorter ones would match too many words
+        :type min_length: int
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.index = {}
+        self.types = {}
+
+    def add(self, entry, entity_type):
+        """ Method that adds an entry of an entity type to the index
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        key = normalize_token(entry)
+        if len(key) < self.min_length:
+            return
+        if key not in self.types:
+            self.types[key] = 0
+            for variant in deletes(key, self.max_distance):
+                self.index.setdefault(variant, []).append(key)
+        self.types[key] |= entity_type
+
+    def remove(self, entry, entity_type):
+        """ Method that removes an entry of an entity type, its deletes are kept in the index
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: PERSON, ORGANIZATION or LOCATION
+        :type entity_type: int
+        :returns: none
+        :rtype: None
+        """
+        key = normalize_token(entry)
+        if key in self.types:
+            self.types[key] &= ~entity_type
+
+    def lookup(self, word):
+        """ Method that returns the entity types of the closest entries within the maximum distance of a word
+
+        :param word: a word to be evaluated
+        :type word: str
+        :returns: bitmask of PERSON, ORGANIZATION and LOCATION, 0 if there is no entry close enough
+        :rtype: int
+
+        :Example:
+
+        >>> import chana.ner
+        >>> gazetteer = chana.ner.FuzzyGazetteer(max_distance=1)
+        >>> gazetteer.add('Pucallpa', chana.ner.LOCATION)
+        >>> gazetteer.lookup('Pukallpa') == chana.ner.LOCATION
+        True
+
+    """
+        key = normalize_token(word)
+        if len(key) < self.min_length:
+            return 0
+        best = self.max_distance + 1
+        types = 0
+        seen = set()
+        for variant in deletes(key, self.max_distance):
+            for entry in self.index.get(variant, ()):
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                if not self.types[entry]:
+                    continue
+                distance = edit_distance(key, entry, self.max_distance)
+                if distance < best:
+                    best = distance
+                    types = self.types[entry]
+                elif distance == best <= self.max_distance:
+                    types |= self.types[entry]
+        return types
+
+
 def is_number(word):
     """ Function that returns 'NUM' if a shipo word is a number or False if not
 
@@ -50,8 +885,7 @@ def is_number(word):
         'NUM'
         
     """
-    numbers=['westiora','rabé','kimisha','chosko','pichika','sokota','kanchis','posaka','iskon','chonka','pacha','waranka']
-    if word.lower() in numbers:
+    if word.lower() in NUMBERS:
         return 'NUM'
     else:
         return False
@@ -71,18 +905,11 @@ def is_location(word):
         'LOC'
         
     """
-    pattern = re.compile('ain|nko|ainko|mea|meax|nkonia|nkoniax|kea|keax|ainoa|ainoax|oa|oax')
-    
-    letters = string.ascii_uppercase + 'Ñ'
-    locations = dict.fromkeys(letters, [])
-    
-    load_array('files/ner/loc_esp_s.dat', locations)
-
     if word.istitle():
         first_letter = word[0]
-        if pattern.search(word):
+        if LOCATION_SUFFIXES.search(word):
             return 'LOC'
-        elif re.search('[ÑA-Z]', first_letter)!=None and re.compile(locations[first_letter]).search(word):
+        elif UPPER_LETTER.search(first_letter)!=None and load_gazetteer('files/ner/loc_esp_s.dat')[first_letter].search(word):
             return 'LOC'
     else:
         return False
@@ -102,14 +929,9 @@ def is_name(word):
         'PER'
         
     """
-    letters = string.ascii_uppercase + 'Ñ'
-    names = dict.fromkeys(letters, [])
-    
-    load_array('files/ner/per_esp_s.dat', names)
-
     if word.title():
         first_letter=word[0]
-        if re.search('[ÑA-Z]', first_letter)!=None and re.compile(names[first_letter]).search(word):
+        if UPPER_LETTER.search(first_letter)!=None and load_gazetteer('files/ner/per_esp_s.dat')[first_letter].search(word):
             return 'PER'
     else:
         return False
@@ -129,14 +951,9 @@ def is_organization(word):
         'ORG'
         
     """
-    letters = string.ascii_uppercase + 'Ñ'
-    organizations = dict.fromkeys(letters, [])
-    
-    load_array('files/ner/org_esp_s.dat', organizations)
-
     if word.title():
         first_letter=word[0]
-        if re.search('[ÑA-Z]', first_letter)!=None and re.compile(organizations[first_letter]).search(word):
+        if UPPER_LETTER.search(first_letter)!=None and load_gazetteer('files/ner/org_esp_s.dat')[first_letter].search(word):
             return 'ORG'
     else:
         return False
@@ -156,36 +973,249 @@ def is_date(word):
         'FEC'
         
     """
-    months=['enero','febrero','marzo','abril','mayo','junio','julio','agosto','setiembre','octubre','noviembre','diciembre']
-    if word.lower() in months:
+    if word.lower() in MONTHS:
         return 'FEC'
 
 
+SENTENCE_END = re.compile(r'[.!?]+(?=\s)|\n[ \t\r\f\v]*\n')
+TOKEN = re.compile(r'\S+')
+
+def iter_sentences(chunks, max_length = 10000):
+    """ Function that splits a text given in chunks into sentences, keeping only the current sentence in memory
+
+        A sentence ends with '.', '!' or '?' followed by whitespace or with a blank line,
+        a sentence longer than max_length characters is cut at a whitespace
+
+        :param chunks: a file object or an iterable of texts, or a single text
+        :type chunks: iterable
+        :param max_length: maximum number of characters of a sentence
+        :type max_length: int
+        :returns: generator of (offset, sentence) with the position of the first character of the sentence in the whole text
+        :rtype: generator
+
+        :Example:
+
+        >>> import chana.ner
+        >>> list(chana.ner.iter_sentences(['Limanko enra atsawe. Ja', 'wen ainbo.']))
+        [(0, 'Limanko enra atsawe.'), (21, 'Jawen ainbo.')]
+
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    buffer = ''
+    offset = 0
+    for chunk in chunks:
+        buffer += chunk
+        start = 0
+        for end in SENTENCE_END.finditer(buffer):
+            yield from sentence_at(buffer[start:end.end()], offset + start)
+            start = end.end()
+        while len(buffer) - start > max_length:
+            cut = buffer.rfind(' ', start, start + max_length)
+            cut = start + max_length if cut <= start else cut
+            yield from sentence_at(buffer[start:cut], offset + start)
+            start = cut
+        buffer = buffer[start:]
+        offset += start
+    yield from sentence_at(buffer, offset)
+
+def sentence_at(text, offset):
+    """
+    Inner function that yields a sentence without its surrounding whitespace and the offset of its first character
+
+    :param text: text of the sentence
+    :type text: str
+    :param offset: position of the text in the whole text
+    :type offset: int
+    :returns: generator with (offset, sentence) or nothing if the text is blank
+    :rtype: generator
+    """
+    stripped = text.lstrip()
+    if stripped:
+        yield offset + len(text) - len(stripped), stripped.rstrip()
+
+
 class ShipiboNER:
     """
     Instance of the rule based NER for shipibo
     """
-    def __init__(self):
+    def __init__(self, persistent_cache = None, feature_cache_size = 10000, max_edit_distance = 0, user_gazetteer = None, min_fuzzy_length = 5):
         """
         Constructor of the class that loads the crf model and the information files
+
+        :param persistent_cache: store shared across runs and processes for the tags of each sentence, None to disable it
+        :type persistent_cache: PersistentCache
+        :param feature_cache_size: maximum number of word types whose crf features are kept, 0 to disable the cache
+        :type feature_cache_size: int
+        :param max_edit_distance: maximum edit distance of the words tagged by a near gazetteer entry, 0 to tag exact matches only.
+            Words and entries shorter than min_fuzzy_length are only matched exactly
+        :type max_edit_distance: int
+        :param user_gazetteer: file where the entries added and removed are kept and loaded on top of the bundled gazetteers, None to keep them in memory only
+        :type user_gazetteer: str
+        :param min_fuzzy_length: minimum number of letters of the words and entries matched with max_edit_distance
+        :type min_fuzzy_length: int
         """
         self.letters = string.ascii_uppercase + 'Ñ'
-        
-        self.names = dict.fromkeys(self.letters, [])
-        self.locations = dict.fromkeys(self.letters, [])
-        self.organizations = dict.fromkeys(self.letters, [])
 
         self.tagger = pycrfsuite.Tagger()
         my_path = os.path.abspath(os.path.dirname(__file__))
         path = os.path.join(my_path, 'files/ner/crf_ner.crfsuite')
         self.tagger.open(path)
+        self.model_path = path
+        # a pycrfsuite tagger must not be shared by threads, each one opens its own
+        self.taggers = threading.local()
+        self.taggers.tagger = self.tagger
+
+
+        self.gazetteer = LayeredGazetteer(open_gazetteers())
+        self.token_gazetteer = None
+        self.fuzzy_gazetteer = None
+
+        self.persistent_cache = persistent_cache
+        self.feature_cache = LRUCache(feature_cache_size) if feature_cache_size else None
+        self.tag_fragments = {}
+        self.base_fingerprint = model_fingerprint(path, __file__, *[os.path.join(my_path, 'files/ner', name)
+                                                  for name in ('per_esp_s.dat', 'loc_esp_s.dat', 'org_esp_s.dat')])
+        if max_edit_distance:
+            self.base_fingerprint = '%s:%s:%s' % (self.base_fingerprint, max_edit_distance, min_fuzzy_length)
+        self.fingerprint = self.base_fingerprint
+
+        self.user_gazetteer = user_gazetteer
+        self.user_changes = hashlib.sha1()
+        if user_gazetteer is not None and os.path.exists(user_gazetteer):
+            with codecs.open(user_gazetteer, "r", encoding= "utf-8") as f:
+                for number, line in enumerate(f.read().splitlines(), 1):
+                    if not line.strip():
+                        continue
+                    fields = line.split('\t', 2)
+                    try:
+                        if len(fields) < 3 or fields[0] not in ('+', '-'):
+                            raise ValueError('A line must be an operation + or -, an entity type and an entry separated by tabs')
+                        self.change_entity(fields[0], fields[2], fields[1], False)
+                    except ValueError as error:
+                        raise ValueError('%s, line %d: %s' % (user_gazetteer, number, error))
+
+        if max_edit_distance:
+            self.fuzzy_gazetteer = FuzzyGazetteer(max_edit_distance, min_fuzzy_length)
+            for entry, entity_type in self.gazetteer.entries():
+                self.fuzzy_gazetteer.add(entry, entity_type)
+
+    def add_entity(self, entry, entity_type):
+        """ Method that adds a gazetteer entry to this instance and to the user gazetteer file if there is one,
+        the entry is matched as literal text while a '.' in the bundled entries matches any character
+
+        :param entry: text of the entry, as it appears in the words to be tagged
+        :type entry: str
+        :param entity_type: 'PER', 'ORG' or 'LOC'
+        :type entity_type: str
+        :returns: none
+        :rtype: None
+
+        :Example:
+
+        >>> import chana.ner
+        >>> ner = chana.ner.ShipiboNER()
+        >>> ner.add_entity('Kakataibo', 'ORG')
+        >>> ner.rule_tag('Kakataibo enra atsawe')
+        ['ORG', 'O', 'O']
+
+    """
+        self.change_entity('+', entry, entity_type)
+
+    def remove_entity(self, entry, entity_type):
+        """ Method that removes a gazetteer entry, bundled or added, from this instance and from the user gazetteer file if there is one
+
+        :param entry: text of the entry
+        :type entry: str
+        :param entity_type: 'PER', 'ORG' or 'LOC'
+        :type entity_type: str
+        :returns: none
+        :rtype: None
+        """
+        self.change_entity('-', entry, entity_type)
+
+    def change_entity(self, operation, entry, name, persist = True):
+        """
+        Inner method that adds or removes a gazetteer entry in all the matchers
+
+        :param operation: '+' to add the entry or '-' to remove it
+        :type operation: str
+        :param entry: text of the entry
+        :type entry: str
+        :param name: 'PER', 'ORG' or 'LOC'
+        :type name: str
+        :param persist: whether the change is written to the user gazetteer file
+        :type persist: bool
+        :returns: none
+        :rtype: None
+        """
+        entity_type = ENTITY_TYPES.get(name)
+        if entity_type is None:
+            raise ValueError("The entity type must be 'PER', 'ORG' or 'LOC', not %r" % (name,))
+        if not entry or entry != entry.strip() or '\t' in entry or '\n' in entry:
+            raise ValueError('The entry must be a non empty text without tabs, new lines or surrounding spaces')
+        if operation == '+':
+            self.gazetteer.add(entry, entity_type)
+            if self.token_gazetteer is not None:
+                self.token_gazetteer.add(entry, entity_type)
+            if self.fuzzy_gazetteer is not None:
+                self.fuzzy_gazetteer.add(entry, entity_type)
+        else:
+            self.gazetteer.remove(entry, entity_type)
+            if self.token_gazetteer is not None or self.fuzzy_gazetteer is not None:
+                # the normalized matchers merge the entries that only differ in case
+                remaining = [other for other, other_type in self.gazetteer.entries() if other_type == entity_type]
+                if self.token_gazetteer is not None and entry.lower().split() not in [other.lower().split() for other in remaining]:
+                    self.token_gazetteer.remove(entry, entity_type)
+                if self.fuzzy_gazetteer is not None and normalize_token(entry) not in [normalize_token(other) for other in remaining]:
+                    self.fuzzy_gazetteer.remove(entry, entity_type)
+        line = '%s\t%s\t%s\n' % (operation, name, entry)
+        # the results of the persistent cache depend on the changes
+        self.user_changes.update(line.encode('utf-8'))
+        self.fingerprint = '%s:%s' % (self.base_fingerprint, self.user_changes.hexdigest())
+        if persist and self.user_gazetteer is not None:
+            with codecs.open(self.user_gazetteer, "a", encoding= "utf-8") as f:
+                f.write(line)
+
+    def cached(self, namespace, sentence, tag):
+        """
+        Inner method that returns the tags of a sentence from the persistent cache or computes and stores them
+
+        :param namespace: name of the tagging method
+        :type namespace: str
+        :param sentence: a sentence to be evaluated
+        :type sentence: str
+        :param tag: function that tags the sentence
+        :type tag: function
+        :returns: list with the ner tags
+        :rtype: list
+        """
+        if self.persistent_cache is None:
+            return tag(sentence)
+        tags = self.persistent_cache.get(namespace, self.fingerprint, sentence)
+        if tags is None:
+            tags = tag(sentence)
+            self.persistent_cache.put(namespace, self.fingerprint, sentence, tags)
+        return tags
 
+    def gazetteer_types(self,words):
+        """
+        Inner method that scans each word once for the entries of the three gazetteers
 
-        load_array('files/ner/per_esp_s.dat',self.names)
-        load_array('files/ner/loc_esp_s.dat',self.locations)
-        load_array('files/ner/org_esp_s.dat',self.organizations)
+        :param words: a list of words to be evaluated
+        :type words: list
+        :returns: list with the bitmask of PERSON, ORGANIZATION and LOCATION of each word
+        :rtype: list
+        """
+        types=[]
+        for word in words:
+            if word and UPPER_LETTER.search(word[0])!=None:
+                types.append(self.gazetteer.match(word))
+            else:
+                types.append(0)
+        return types
 
-    def check_locations(self,words,entity_tag):
+    def check_locations(self,words,entity_tag,types=None):
         """
         Inner method that tags the locations of a sentence with 'LOC'
 
@@ -193,24 +1223,26 @@ class ShipiboNER:
         :type words: list
         :param entity_tag: a list of words to be evaluated
         :type entity_tag: list
+        :param types: gazetteer types of the words, they are computed if not given
+        :type types: list
         :returns: none
         :rtype: None
         """
-        pattern = re.compile('ain|nko|ainko|mea|meax|nkonia|nkoniax|kea|keax|ainoa|ainoax|oa|oax')
+        if types is None:
+            types=self.gazetteer_types(words)
         idWord=0
         last_Loc=-1
         for word in words:
             if word.istitle():
-                first_letter=word[0]
-                if pattern.search(word):
+                if LOCATION_SUFFIXES.search(word):
                     entity_tag[idWord]='LOC'
                     last_Loc=idWord
-                elif re.search('[ÑA-Z]', first_letter)!=None and re.compile(self.locations[first_letter]).search(word):
+                elif types[idWord] & LOCATION:
                         entity_tag[idWord]='LOC'
                         last_Loc=idWord
             idWord+=1
 
-    def check_names(self,words,entity_tag):
+    def check_names(self,words,entity_tag,types=None):
         """
         Inner method that tags the names/persons of a sentence with 'PER'
 
@@ -218,20 +1250,23 @@ class ShipiboNER:
         :type words: list
         :param entity_tag: a list of words to be evaluated
         :type entity_tag: list
+        :param types: gazetteer types of the words, they are computed if not given
+        :type types: list
         :returns: none
         :rtype: None
         """
+        if types is None:
+            types=self.gazetteer_types(words)
         idWord=0
         last_per=-1
         for word in words:
             if word.title():
-                first_letter=word[0]
-                if re.search('[ÑA-Z]', first_letter)!=None and re.compile(self.names[first_letter]).search(word):
+                if types[idWord] & PERSON:
                     entity_tag[idWord]='PER'
                     last_per=idWord
             idWord+=1
 
-    def check_organizations(self,words,entity_tag):
+    def check_organizations(self,words,entity_tag,types=None):
         """
         Inner method that tags the organizations of a sentence with 'ORG'
 
@@ -239,15 +1274,18 @@ class ShipiboNER:
         :type words: list
         :param entity_tag: a list of words to be evaluated
         :type entity_tag: list
+        :param types: gazetteer types of the words, they are computed if not given
+        :type types: list
         :returns: none
         :rtype: None
         """
+        if types is None:
+            types=self.gazetteer_types(words)
         idWord=0
         last_org=-1
         for word in words:
             if word.title():
-                first_letter=word[0]
-                if re.search('[ÑA-Z]', first_letter)!=None and re.compile(self.organizations[first_letter]).search(word):
+                if types[idWord] & ORGANIZATION:
                     entity_tag[idWord]='ORG'
                     last_org=idWord
             idWord+=1
@@ -263,10 +1301,9 @@ class ShipiboNER:
         :returns: none
         :rtype: None
         """
-        numbers=['westiora','rabé','kimisha','chosko','pichika','sokota','kanchis','posaka','iskon','chonka','pacha','waranka']
         idWord=0
         for word in words:
-            if word.lower() in numbers:
+            if word.lower() in NUMBERS:
                 entity_tag[idWord]='NUM'
             idWord+=1
 
@@ -281,11 +1318,10 @@ class ShipiboNER:
         :returns: none
         :rtype: None
         """
-        months=['enero','febrero','marzo','abril','mayo','junio','julio','agosto','setiembre','octubre','noviembre','diciembre']
         idWord=0
         last_date=-1
         for word in words:
-            if word.lower() in months:
+            if word.lower() in MONTHS:
                 entity_tag[idWord]='FEC'
                 last_date=idWord
                 if idWord > 0:
@@ -314,17 +1350,177 @@ class ShipiboNER:
         ['LOC', 'O', 'O']
         
     """
+        return self.cached('ner-rule', sentence, self.predict_rule_tags)
+
+    def predict_rule_tags(self, sentence):
+        """
+        Inner method that tags a sentence with the rules
+
+        :param sentence: a sentence to be evaluated
+        :type sentence: str
+        :returns: list with the ner tags
+        :rtype: list
+        """
         words=sentence.split()
-        entity_tag=[]
-        for x in range(len(words)):
-            entity_tag.append('O')
-        self.check_names(words,entity_tag)
-        self.check_organizations(words,entity_tag)
-        self.check_locations(words,entity_tag)
-        self.check_numbers(words,entity_tag)
-        self.check_dates(words,entity_tag)
+        entity_tag=['O']*len(words)
+        last=len(words)-1
+        match=self.gazetteer.match
+        # single pass with the priority of the check methods, the later ones win: dates, numbers, locations, organizations, names
+        for idWord, word in enumerate(words):
+            lower=word.lower()
+            if lower in MONTHS:
+                entity_tag[idWord]='FEC'
+                if idWord > 0 and words[idWord-1].isdigit():
+                    entity_tag[idWord-1]='FEC'
+                if idWord < last and words[idWord+1].isdigit():
+                    entity_tag[idWord+1]='FEC'
+            elif lower in NUMBERS:
+                entity_tag[idWord]='NUM'
+            elif entity_tag[idWord]=='O':
+                title=word.istitle()
+                if title and LOCATION_SUFFIXES.search(word):
+                    entity_tag[idWord]='LOC'
+                elif UPPER_LETTER.search(word[0])!=None:
+                    types=match(word)
+                    if not types and self.fuzzy_gazetteer is not None:
+                        types=self.fuzzy_gazetteer.lookup(word)
+                    if title and types & LOCATION:
+                        entity_tag[idWord]='LOC'
+                    elif types & ORGANIZATION:
+                        entity_tag[idWord]='ORG'
+                    elif types & PERSON:
+                        entity_tag[idWord]='PER'
         return entity_tag
 
+    def stream_entities(self, chunks, method = 'rule', max_length = 10000):
+        """ Method that tags a text given in chunks, sentence by sentence, and yields its entities
+        with their position in the whole text, the memory used does not grow with the size of the text
+
+        The consecutive words with the same tag of rule_tag are joined in a single entity. The tags of crf_tag
+        mark the beginning, inside, end or single word of an entity with a B-, I-, E- or S- prefix: an entity
+        starts at B- or S- or when the type changes, goes on with I- and E- and ends after E- or S-, and the
+        prefix is not part of the type
+
+        :param chunks: a file object or an iterable of texts, or a single text
+        :type chunks: iterable
+        :param method: 'rule' to tag with rule_tag or 'crf' to tag with crf_tag
+        :type method: str
+        :param max_length: maximum number of characters of a sentence, longer ones are cut at a whitespace
+        :type max_length: int
+        :returns: generator of (start, end, type, text) with text equal to the characters start:end of the whole text
+        :rtype: generator
+
+        :Example:
+
+        >>> import chana.ner
+        >>> ner = chana.ner.ShipiboNER()
+        >>> list(ner.stream_entities(['Enero 12 Limanko enra', ' atsawe. Juan jawen ainbo.']))
+        [(0, 8, 'FEC', 'Enero 12'), (9, 16, 'LOC', 'Limanko'), (30, 34, 'PER', 'Juan')]
+        >>> list(ner.stream_entities('Juan Perez jawen ainbo iki.', method='crf'))
+        [(0, 10, 'PER', 'Juan Perez')]
+
+    """
+        if method not in ('rule', 'crf'):
+            raise ValueError("The method must be 'rule' or 'crf', not %r" % (method,))
+        tag = self.rule_tag if method == 'rule' else self.crf_tag
+        for offset, sentence in iter_sentences(chunks, max_length):
+            tokens = list(TOKEN.finditer(sentence))
+            tags = tag(sentence)
+            entity = None
+            for token, token_tag in zip(tokens, tags):
+                prefix, _, entity_type = token_tag.rpartition('-')
+                if prefix not in ('B', 'I', 'E', 'S'):
+                    prefix, entity_type = '', token_tag
+                if entity is not None and (entity_type != entity[2] or prefix in ('B', 'S')):
+                    yield offset + entity[0], offset + entity[1], entity[2], sentence[entity[0]:entity[1]]
+                    entity = None
+                if entity_type == 'O':
+                    continue
+                if entity is None:
+                    entity = [token.start(), token.end(), entity_type]
+                else:
+                    entity[1] = token.end()
+                if prefix in ('E', 'S'):
+                    yield offset + entity[0], offset + entity[1], entity[2], sentence[entity[0]:entity[1]]
+                    entity = None
+            if entity is not None:
+                yield offset + entity[0], offset + entity[1], entity[2], sentence[entity[0]:entity[1]]
+
+    def span_tag(self, sentence):
+        """ Method that tags a sentence with the longest gazetteer entries of one or more words,
+        an alternative to rule_tag that matches whole words instead of substrings
+
+        :param sentence: a sentence to be evaluated
+        :type sentence: str
+        :returns: list with the IOB tags and list of (start, end, type) spans of the entities
+        :rtype: tuple
+
+        :Example:
+
+        >>> import chana.ner
+        >>> ner = chana.ner.ShipiboNER()
+        >>> ner.span_tag('Lima ainbo Bolivia nko ka')
+        (['B-LOC', 'O', 'B-LOC', 'O', 'O'], [(0, 1, 'LOC'), (2, 3, 'LOC')])
+
+    """
+        if self.token_gazetteer is None:
+            self.token_gazetteer = TokenGazetteer()
+            for entry, entity_type in self.gazetteer.entries():
+                self.token_gazetteer.add(entry, entity_type)
+        words=sentence.split()
+        spans=self.token_gazetteer.spans(words)
+        return spans_to_iob(spans, len(words)), spans
+
+    def word_features(self,word):
+        """
+        Inner method that returns the features of a word type, they are kept in the feature cache
+        so the tokens of the same word share the same strings
+
+        :param word: a word
+        :type word: str
+        :returns: lists with the features of the word as current, previous and next word
+        :rtype: tuple
+        """
+        fragments = None if self.feature_cache is None else self.feature_cache.get(word)
+        if fragments is None:
+            lower = word.lower()
+            isupper = '%s' % word.isupper()
+            istitle = '%s' % word.istitle()
+            fragments = (
+                ['word.lower=' + lower,
+                 'word[-3:]=' + word[-3:],
+                 'word[-2:]=' + word[-2:],
+                 'word.isupper=' + isupper,
+                 'word.istitle=' + istitle,
+                 'word.isdigit=%s' % word.isdigit()],
+                ['-1:word.lower=' + lower,
+                 '-1:word.istitle=' + istitle,
+                 '-1:word.isupper=' + isupper],
+                ['+1:word.lower=' + lower,
+                 '+1:word.istitle=' + istitle,
+                 '+1:word.isupper=' + isupper],
+            )
+            if self.feature_cache is not None:
+                self.feature_cache.put(word, fragments)
+        return fragments
+
+    def tag_features(self,tagBR):
+        """
+        Inner method that returns the features of a rule tag
+
+        :param tagBR: a tag of the rule based system
+        :type tagBR: str
+        :returns: lists with the features of the tag of the current, previous and next word
+        :rtype: tuple
+        """
+        fragments = self.tag_fragments.get(tagBR)
+        if fragments is None:
+            fragments = (['tagBR=' + tagBR, 'tagBR[:2]=' + tagBR[:2]],
+                         ['-1:tagBR=' + tagBR, '-1:tagBR[:2]=' + tagBR[:2]],
+                         ['+1:tagBR=' + tagBR, '+1:tagBR[:2]=' + tagBR[:2]])
+            self.tag_fragments[tagBR] = fragments
+        return fragments
+
     def word2features(self,sent, i):
         """
         Inner method that add features to the words of a sentence to be tagged by the crf model
@@ -336,46 +1532,35 @@ class ShipiboNER:
         :returns: list with the features for the indexed word
         :rtype: list
         """
-        word = sent[i][0]
-        tagBR = sent[i][1]
-        features = [
-            'bias',
-            'word.lower=' + word.lower(),
-            'word[-3:]=' + word[-3:],
-            'word[-2:]=' + word[-2:],
-            'word.isupper=%s' % word.isupper(),
-            'word.istitle=%s' % word.istitle(),
-            'word.isdigit=%s' % word.isdigit(),
-            'tagBR=' + tagBR,
-            'tagBR[:2]=' + tagBR[:2],
-        ]
+        window = sent[max(i-1, 0):i+2]
+        words = [self.word_features(word) for word, tagBR in window]
+        tags = [self.tag_features(tagBR) for word, tagBR in window]
+        return self.join_features(words, tags, min(i, 1))
+
+    def join_features(self,words,tags,i):
+        """
+        Inner method that concatenates the cached features of a word with the ones of its neighbours
+
+        :param words: features of each word type of the sentence, as returned by word_features
+        :type words: list
+        :param tags: features of each rule tag of the sentence, as returned by tag_features
+        :type tags: list
+        :param i: index of the word to be evaluated
+        :type i: int
+        :returns: list with the features for the indexed word
+        :rtype: list
+        """
+        features = ['bias'] + words[i][0] + tags[i][0]
         if i > 0:
-            word1 = sent[i-1][0]
-            tagBR1 = sent[i-1][1]
-            features.extend([
-                '-1:word.lower=' + word1.lower(),
-                '-1:word.istitle=%s' % word1.istitle(),
-                '-1:word.isupper=%s' % word1.isupper(),
-                '-1:tagBR=' + tagBR1,
-                '-1:tagBR[:2]=' + tagBR1[:2],
-            ])
+            features += words[i-1][1]
+            features += tags[i-1][1]
         else:
             features.append('BOS')
-
-
-        if i < len(sent)-1:
-            word1 = sent[i+1][0]
-            tagBR1 = sent[i+1][1]
-            features.extend([
-                '+1:word.lower=' + word1.lower(),
-                '+1:word.istitle=%s' % word1.istitle(),
-                '+1:word.isupper=%s' % word1.isupper(),
-                '+1:tagBR=' + tagBR1,
-                '+1:tagBR[:2]=' + tagBR1[:2],
-            ])
+        if i < len(words)-1:
+            features += words[i+1][2]
+            features += tags[i+1][2]
         else:
             features.append('EOS')
-
         return features
 
     def sent2features(self,sent):
@@ -388,7 +1573,9 @@ class ShipiboNER:
         :rtype: list
 
         """
-        return [self.word2features(sent, i) for i in range(len(sent))]
+        words = [self.word_features(word) for word, tagBR in sent]
+        tags = [self.tag_features(tagBR) for word, tagBR in sent]
+        return [self.join_features(words, tags, i) for i in range(len(sent))]
 
     def crf_tag(self,sentence):
         """ Method that tags a sentence with the rule based method and then with the crf model
@@ -406,6 +1593,17 @@ class ShipiboNER:
         ['LOC', 'O', 'O']
         
     """
+        return self.cached('ner-crf', sentence, self.predict_crf_tags)
+
+    def predict_crf_tags(self, sentence):
+        """
+        Inner method that tags a sentence with the rules and then with the crf model
+
+        :param sentence: a sentence to be evaluated
+        :type sentence: str
+        :returns: list with the ner tags
+        :rtype: list
+        """
         entity_tag_R=self.rule_tag(sentence)
         vectorWord=[]
         words=sentence.split()
@@ -415,5 +1613,75 @@ class ShipiboNER:
                 result_tag=(word,tag_r)
                 vectorWord.append(result_tag)
                 idWord+=1
-        entity_tag=self.tagger.tag(self.sent2features(vectorWord))
-        return entity_tag
\ No newline at end of file
+        entity_tag=self.thread_tagger().tag(self.sent2features(vectorWord))
+        return entity_tag
+
+    def thread_tagger(self):
+        """
+        Inner method that returns the crf tagger of the current thread, it is opened on the first call of each thread
+
+        :returns: tagger opened on the crf model
+        :rtype: pycrfsuite.Tagger
+        """
+        tagger = getattr(self.taggers, 'tagger', None)
+        if tagger is None:
+            tagger = pycrfsuite.Tagger()
+            tagger.open(self.model_path)
+            self.taggers.tagger = tagger
+        return tagger
+
+    def predict_crf_chunk(self, sentences):
+        """
+        Inner method that tags some sentences with the rules and then with the crf tagger of the current thread
+
+        :param sentences: sentences to be evaluated
+        :type sentences: list
+        :returns: list with the ner tags of each sentence
+        :rtype: list
+        """
+        tagger=self.thread_tagger()
+        results=[]
+        for sentence in sentences:
+            vectorWord=list(zip(sentence.split(), self.predict_rule_tags(sentence)))
+            results.append(tagger.tag(self.sent2features(vectorWord)))
+        return results
+
+    def crf_tag_many(self, sentences, n_jobs = 1, chunk_size = 64):
+        """ Method that tags several sentences with the rule based method and then with the crf model
+
+        :param sentences: sentences to be evaluated
+        :type sentences: iterable
+        :param n_jobs: number of threads, each one with its own crf tagger, 1 to tag in this thread
+        :type n_jobs: int
+        :param chunk_size: number of sentences given to a thread at a time
+        :type chunk_size: int
+        :returns: list with the ner tags of each sentence, in the order of the sentences
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.ner
+        >>> ner = chana.ner.ShipiboNER()
+        >>> ner.crf_tag_many(['Limanko enra atsawe', 'Enero Limanko atsa enra piawe'], n_jobs=2)
+        [['LOC', 'O', 'O'], ['O', 'LOC', 'O', 'O', 'O']]
+
+    """
+        sentences=list(sentences)
+        found={}
+        if self.persistent_cache is not None:
+            found=self.persistent_cache.get_many('ner-crf', self.fingerprint, sentences)
+        # repeated sentences are tagged once
+        missing=list(collections.OrderedDict.fromkeys(sentence for sentence in sentences if sentence not in found))
+        parts=[missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+        if n_jobs > 1 and len(parts) > 1:
+            with concurrent.futures.ThreadPoolExecutor(n_jobs) as pool:
+                results=list(pool.map(self.predict_crf_chunk, parts))
+        else:
+            results=[self.predict_crf_chunk(part) for part in parts]
+        tagged={}
+        for part, tags in zip(parts, results):
+            tagged.update(zip(part, tags))
+        if self.persistent_cache is not None and tagged:
+            self.persistent_cache.put_many('ner-crf', self.fingerprint, tagged.items())
+        found.update(tagged)
+        return [list(found[sentence]) for sentence in sentences]
@@ -3,24 +3,306 @@
 Part-of-Speech (POS) Tagger for shipibo-konibo.
 Source model is from the Chana project
 """
+import collections
+import hashlib
+import json
 import os
-from sklearn.externals import joblib
+import numpy as np
 import warnings
+import zlib
+from .cache import LRUCache, model_fingerprint
 
 warnings.filterwarnings("ignore")
 
 
+class LinearModel:
+    """
+    Linear classifier over dicts of features that scores a word by summing the weight rows of its features,
+    compiled from the scikit-learn pipeline of a DictVectorizer and a linear SVM or trained by GeneralPosTagger.
+    The column of a feature is found in the vocabulary or, if n_features is set, is a hash of its name
+    """
+
+    def __init__(self, vocabulary, weights, intercept, classes, separator = '=', n_features = None):
+        """
+        Constructor of the class with the parameters of the model
+
+        :param vocabulary: column of each feature name
+        :type vocabulary: dict
+        :param weights: matrix with a row of scores by class for each column
+        :type weights: numpy.ndarray
+        :param intercept: score of each class
+        :type intercept: numpy.ndarray
+        :param classes: tags of the classes
+        :type classes: list
+        :param separator: separator between the name and the value of the string features
+        :type separator: str
+        :param n_features: number of columns the feature names are hashed into, None to use the vocabulary
+        :type n_features: int
+        """
+        self.vocabulary = vocabulary
+        self.weights = weights
+        self.intercept = intercept
+        self.classes_ = np.asarray(classes)
+        self.separator = separator
+        self.n_features = n_features
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """ Method that extracts the linear model of a fitted scikit-learn pipeline
+
+        :param pipeline: pipeline with a DictVectorizer and a linear classifier with coef_ and intercept_
+        :type pipeline: sklearn.pipeline.Pipeline
+        :returns: the linear model
+        :rtype: LinearModel
+        """
+        vectorizer = pipeline.steps[0][1]
+        classifier = pipeline.steps[-1][1]
+        return cls(dict(vectorizer.vocabulary_), np.ascontiguousarray(classifier.coef_.T),
+                   np.array(classifier.intercept_), list(classifier.classes_), vectorizer.separator)
+
+    @classmethod
+    def load(cls, path):
+        """ Method that loads a linear model saved in a directory
+
+        :param path: directory of the model
+        :type path: str
+        :returns: the linear model
+        :rtype: LinearModel
+        """
+        with open(os.path.join(path, 'model.json'), encoding='utf-8') as f:
+            model = json.load(f)
+        return cls(model['vocabulary'], np.load(os.path.join(path, 'weights.npy')),
+                   np.load(os.path.join(path, 'intercept.npy')), model['classes'], model['separator'], model.get('n_features'))
+
+    def save(self, path):
+        """ Method that saves the model in a directory as a json file with the vocabulary and the classes and npy files with the weights
+
+        :param path: directory of the model, it is created if it does not exist
+        :type path: str
+        :returns: none
+        :rtype: None
+        """
+        os.makedirs(path, exist_ok=True)
+        model = {'classes': [str(tag) for tag in self.classes_], 'separator': self.separator, 'vocabulary': self.vocabulary}
+        if self.n_features is not None:
+            model['n_features'] = self.n_features
+        with open(os.path.join(path, 'model.json'), 'w', encoding='utf-8') as f:
+            json.dump(model, f, ensure_ascii=False, sort_keys=True)
+        np.save(os.path.join(path, 'weights.npy'), self.weights)
+        np.save(os.path.join(path, 'intercept.npy'), self.intercept)
+
+    def hashed_column(self, name):
+        """ Method that returns the column of a feature name in a hashed model, the same in every run
+
+        :param name: name of the feature
+        :type name: str
+        :returns: the column of the feature
+        :rtype: int
+        """
+        return zlib.crc32(name.encode('utf-8')) % self.n_features
+
+    def columns(self, features):
+        """ Method that returns the columns and values of a dict of features like the DictVectorizer,
+        the string features are named name=value with value 1 and the unknown ones are ignored
+
+        :param features: features of a word
+        :type features: dict
+        :returns: list of the columns and list of their values
+        :rtype: tuple
+        """
+        column_of = self.vocabulary.get if self.n_features is None else self.hashed_column
+        columns = []
+        values = []
+        for name, value in features.items():
+            if isinstance(value, str):
+                name = name + self.separator + value
+                value = 1
+            column = column_of(name)
+            if column is not None and value:
+                columns.append(column)
+                values.append(value)
+        return columns, values
+
+    def decision_function(self, features):
+        """ Method that returns the score of each class for several dicts of features
+
+        :param features: list with the features of each word
+        :type features: list
+        :returns: matrix with a row of scores by class for each word
+        :rtype: numpy.ndarray
+        """
+        scores = np.tile(self.intercept, (len(features), 1))
+        columns = []
+        values = []
+        starts = []
+        rows = []
+        for row, feature in enumerate(features):
+            row_columns, row_values = self.columns(feature)
+            if row_columns:
+                rows.append(row)
+                starts.append(len(columns))
+                columns.extend(row_columns)
+                values.extend(row_values)
+        if columns:
+            contributions = self.weights[columns]
+            if any(value != 1 for value in values):
+                contributions *= np.asarray(values, dtype=self.weights.dtype)[:, None]
+            scores[rows] += np.add.reduceat(contributions, starts)
+        return scores
+
+    def value_rows(self, name, values):
+        """ Method that returns the weight rows of the values of a string feature
+
+        :param name: name of the feature
+        :type name: str
+        :param values: values of the feature
+        :type values: list
+        :returns: matrix with the scores by class of each value, zeros for the values unknown to the model
+        :rtype: numpy.ndarray
+        """
+        column_of = self.vocabulary.get if self.n_features is None else self.hashed_column
+        rows = np.zeros((len(values), len(self.classes_)), dtype=self.weights.dtype)
+        for row, value in enumerate(values):
+            column = column_of(name + self.separator + value)
+            if column is not None:
+                rows[row] = self.weights[column]
+        return rows
+
+    def predict(self, features):
+        """ Method that predicts the class of several dicts of features
+
+        :param features: list with the features of each word
+        :type features: list
+        :returns: array with the tag of each word
+        :rtype: numpy.ndarray
+
+        :Example:
+
+        >>> import chana.pos_tagger
+        >>> tagger = chana.pos_tagger.ShipiboPosTagger(backend='numpy')
+        >>> tagger.postagger.predict([tagger.features(['Atsa', 'ea', 'piai'], ['', '', ''], 0)])
+        array(['NOUN'], dtype='<U5')
+
+    """
+        return self.classes_[self.decision_function(features).argmax(axis=1)]
+
+
+def compile_model(path = None):
+    """ Function that compiles the pickled svm pipeline of the pos tagger into the linear model used by the numpy backend,
+    it needs scikit-learn and must be run again when the pickle changes
+
+    :param path: directory of the compiled model, by default the one of the package
+    :type path: str
+    :returns: the directory of the compiled model
+    :rtype: str
+    """
+    from sklearn.externals import joblib
+    my_path = os.path.abspath(os.path.dirname(__file__))
+    if path is None:
+        path = os.path.join(my_path, LINEAR_MODEL)
+    LinearModel.from_pipeline(joblib.load(os.path.join(my_path, SVM_MODEL))).save(path)
+    return path
+
+
+def log_softmax(scores):
+    """ Function that turns the scores of the classes in the last axis into log-probabilities
+
+    :param scores: array of scores
+    :type scores: numpy.ndarray
+    :returns: array of log-probabilities with the same shape
+    :rtype: numpy.ndarray
+    """
+    shifted = scores - scores.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+SVM_MODEL = 'files/pos_tagger/shipibo_svm_model.pkl'
+LINEAR_MODEL = 'files/pos_tagger/shipibo_linear_model'
+
+
 class ShipiboPosTagger:
     """
     Instance of the pre-trained shipibo part-of-speech tagger
     """
 
-    def __init__(self):
+    def __init__(self, persistent_cache = None, backend = 'sklearn', score_cache_size = 0, decoder = 'greedy', beam_width = 4):
         """ Constructor of the ShipiboPosTagger class that loads the pretrained model    
+
+        :param persistent_cache: store shared across runs and processes for the tags of each sentence, None to disable it
+        :type persistent_cache: PersistentCache
+        :param backend: 'sklearn' to use the pickled svm pipeline or 'numpy' to use the compiled linear model without scikit-learn
+        :type backend: str
+        :param score_cache_size: maximum number of word contexts whose scores without the previous tags are kept, 0 to score every word with the model
+        :type score_cache_size: int
+        :param decoder: 'greedy' to tag each word with the best tag after the previous ones, 'beam' to keep the best beam_width sequences or 'viterbi' to find the best sequence
+        :type decoder: str
+        :param beam_width: number of sequences kept at each word by the beam decoder
+        :type beam_width: int
     """
+        if backend not in ('sklearn', 'numpy'):
+            raise ValueError("The backend must be 'sklearn' or 'numpy', not %r" % (backend,))
+        self.set_decoder(decoder, beam_width)
         my_path = os.path.abspath(os.path.dirname(__file__))
-        path = os.path.join(my_path, "files/pos_tagger/shipibo_svm_model.pkl")
-        self.postagger = joblib.load(path)
+        self.backend = backend
+        if backend == 'sklearn':
+            from sklearn.externals import joblib
+            path = os.path.join(my_path, SVM_MODEL)
+            self.postagger = joblib.load(path)
+            self.fingerprint = model_fingerprint(path, __file__)
+        else:
+            path = os.path.join(my_path, LINEAR_MODEL)
+            self.postagger = LinearModel.load(path)
+            self.fingerprint = model_fingerprint(*[os.path.join(path, name) for name in ('model.json', 'weights.npy', 'intercept.npy')] + [__file__])
+        self.fingerprint += self.decoder_key()
+        self.persistent_cache = persistent_cache
+        self.score_cache = LRUCache(score_cache_size) if score_cache_size else None
+        self.linear = None
+        if score_cache_size or decoder != 'greedy':
+            self.split_model(self.postagger if backend == 'numpy' else LinearModel.from_pipeline(self.postagger))
+
+    def set_decoder(self, decoder, beam_width):
+        """ Inner method that checks and keeps the decoder and the beam width
+
+        :param decoder: 'greedy', 'beam' or 'viterbi'
+        :type decoder: str
+        :param beam_width: number of sequences kept at each word by the beam decoder
+        :type beam_width: int
+        :returns: none
+        :rtype: None
+    """
+        if decoder not in ('greedy', 'beam', 'viterbi'):
+            raise ValueError("The decoder must be 'greedy', 'beam' or 'viterbi', not %r" % (decoder,))
+        if beam_width < 1:
+            raise ValueError("The beam width must be at least 1, not %r" % (beam_width,))
+        self.decoder = decoder
+        self.beam_width = beam_width
+
+    def decoder_key(self):
+        """ Inner method that returns the part of the fingerprint that depends on the decoder, since the stored tags depend on it
+
+        :returns: empty for the greedy decoder
+        :rtype: str
+    """
+        if self.decoder == 'greedy':
+            return ''
+        return ':' + (self.decoder if self.decoder == 'viterbi' else 'beam%d' % self.beam_width)
+
+    def split_model(self, linear):
+        """ Inner method that keeps the linear model used to score the context of a word apart from its two previous tags,
+        it must be called again when the weights of the model change
+
+        :param linear: the linear model of the tagger
+        :type linear: LinearModel
+        :returns: none
+        :rtype: None
+    """
+        # the score of a word is the score of its context plus the weights of its two previous tags
+        self.linear = linear
+        self.tag_values = [''] + [str(tag) for tag in linear.classes_]
+        self.tag_rows = {tag: row for row, tag in enumerate(self.tag_values)}
+        self.history = (linear.value_rows('tag-1', self.tag_values), linear.value_rows('tag-2', self.tag_values))
+        if self.score_cache is not None:
+            self.score_cache.clear()
 
 
     def features(self, sentence, tags, index):
@@ -81,6 +363,78 @@ class ShipiboPosTagger:
         ['NOUN', 'PRON', 'VERB']
         
     """
+        if self.persistent_cache is not None:
+            tags = self.persistent_cache.get('pos', self.fingerprint, sentence)
+            if tags is None:
+                tags = self.predict_tags(sentence)
+                self.persistent_cache.put('pos', self.fingerprint, sentence, tags)
+            return tags
+        return self.predict_tags(sentence)
+
+    def static_scores(self, words):
+        """ Inner method that returns the scores of several words without their tag-1 and tag-2 features,
+        they are kept in the score cache and the missing ones are scored together
+
+        :param words: (words of the sentence, position of the word) pairs
+        :type words: list
+        :returns: list with the array of the score of each class of each word
+        :rtype: list
+    """
+        keys = []
+        for tokens, index in words:
+            last = len(tokens) - 1
+            # everything but the previous tags depends on the word, its neighbours, its position and the length of the sentence up to 4
+            keys.append((tokens[index - 1] if index > 0 else '', tokens[index], tokens[index + 1] if index < last else '',
+                         index == 0, index == last, min(len(tokens), 4)))
+        if self.score_cache is None:
+            scores = [None] * len(keys)
+        else:
+            scores = [self.score_cache.get(key) for key in keys]
+        missing = [k for k, row in enumerate(scores) if row is None]
+        if missing:
+            feats = []
+            for k in missing:
+                tokens, index = words[k]
+                feats.append(self.features(tokens, [''] * len(tokens), index))
+                del feats[-1]['tag-1'], feats[-1]['tag-2']
+            for k, row in zip(missing, self.linear.decision_function(feats)):
+                scores[k] = row
+                if self.score_cache is not None:
+                    self.score_cache.put(keys[k], row)
+        return scores
+
+    def history_rows(self, tags, index):
+        """ Inner method that returns the rows of the tag-1 and tag-2 weights of a word
+
+        :param tags: the tags predicted for the previous words
+        :type tags: list
+        :param index: position of the word in the sentence
+        :type index: int
+        :returns: row of the tag-1 value and row of the tag-2 value
+        :rtype: tuple
+    """
+        return (self.tag_rows.get('' if index == 0 else tags[index - 1], 0),
+                self.tag_rows.get('' if index < 2 else tags[index - 2], 0))
+
+    def predict_tags(self, sentence):
+        """ Inner method that predicts the pos-tags of a shipibo sentence with the model
+
+        :param sentence: a sentence in shipibo-konibo
+        :type sentence: str
+        :returns: list of the tags in UD format
+        :rtype: list
+    """
+        if self.decoder != 'greedy':
+            tokens = sentence.split(" ")
+            return self.decode(np.array(self.static_scores([(tokens, i) for i in range(len(tokens))])))
+        if self.score_cache is not None:
+            tokens = sentence.split(" ")
+            tags = []
+            for i in range(len(tokens)):
+                previous, second = self.history_rows(tags, i)
+                scores = self.static_scores([(tokens, i)])[0] + self.history[0][previous] + self.history[1][second]
+                tags.append(self.linear.classes_[scores.argmax()])
+            return tags
         tags = []
         tokens = sentence.split(" ")
         for i in range(len(tokens)):
@@ -92,6 +446,153 @@ class ShipiboPosTagger:
             tags[i] = tag_predicted
         return tags
 
+    def decode(self, scores):
+        """ Inner method that finds the tags of a sentence with the beam or the viterbi decoder
+
+        :param scores: array with the score of each class of each word without the tag-1 and tag-2 features
+        :type scores: numpy.ndarray
+        :returns: list of the tags in UD format
+        :rtype: list
+    """
+        if self.decoder == 'viterbi':
+            return self.viterbi_tags(scores)
+        return self.beam_tags(scores, self.beam_width)
+
+    def beam_tags(self, scores, beam_width):
+        """ Inner method that finds the tags of a sentence keeping the best beam_width sequences at each word,
+        all the sequences of a word are extended with one matrix operation
+
+        :param scores: array with the score of each class of each word without the tag-1 and tag-2 features
+        :type scores: numpy.ndarray
+        :param beam_width: number of sequences kept at each word
+        :type beam_width: int
+        :returns: list of the tags in UD format
+        :rtype: list
+    """
+        classes = len(self.linear.classes_)
+        # the rows of the tags of the last two words and the log-probability of each sequence
+        previous = np.zeros(1, dtype=np.intp)
+        second = np.zeros(1, dtype=np.intp)
+        totals = np.zeros(1)
+        beams = []
+        chosen = []
+        for row in scores:
+            candidates = totals[:, None] + log_softmax(row + self.history[0][previous] + self.history[1][second])
+            # a stable sort keeps the first of equal scores, as argmax does
+            best = np.argsort(-candidates.ravel(), kind='stable')[:beam_width]
+            beam, tag = np.divmod(best, classes)
+            beams.append(beam)
+            chosen.append(tag)
+            totals = candidates.ravel()[best]
+            second = previous[beam]
+            previous = tag + 1
+        tags = []
+        k = 0
+        for beam, tag in zip(reversed(beams), reversed(chosen)):
+            tags.append(self.tag_values[tag[k] + 1])
+            k = beam[k]
+        return tags[::-1]
+
+    def viterbi_tags(self, scores):
+        """ Inner method that finds the sequence of tags of a sentence with the highest log-probability,
+        the states are the tags of the last two words and all of them are extended with one matrix operation
+
+        :param scores: array with the score of each class of each word without the tag-1 and tag-2 features
+        :type scores: numpy.ndarray
+        :returns: list of the tags in UD format
+        :rtype: list
+    """
+        rows = len(self.tag_values)
+        # best log-probability of each (tag-2, tag-1) state, both sentence starts before the first word
+        totals = np.full((rows, rows), -np.inf)
+        totals[0, 0] = 0.0
+        back = []
+        # history[tag-2, tag-1, tag]
+        history = self.history[0][None, :, :] + self.history[1][:, None, :]
+        for row in scores:
+            candidates = totals[:, :, None] + log_softmax(row + history)
+            best = candidates.argmax(axis=0)
+            totals = np.full((rows, rows), -np.inf)
+            totals[:, 1:] = np.take_along_axis(candidates, best[None], axis=0)[0]
+            back.append(best)
+        previous, last = np.unravel_index(totals.argmax(), totals.shape)
+        path = [last]
+        for best in reversed(back[1:]):
+            previous, last = best[previous, last - 1], previous
+            path.append(last)
+        return [self.tag_values[row] for row in reversed(path)]
+
+    def pos_tag_many(self, sentences, chunk_size = 1024):
+        """ Method that predict the pos-tags of several shipibo sentences in the UD format, the words of the
+        same position in all the sentences are tagged with one call to the model
+
+        :param sentences: sentences in shipibo-konibo
+        :type sentences: iterable
+        :param chunk_size: number of sentences decoded together
+        :type chunk_size: int
+        :returns: list with the list of the tags of each sentence, in the order of the sentences
+        :rtype: list
+
+        :Example:
+
+        >>> import chana.pos_tagger
+        >>> tagger = chana.pos_tagger.ShipiboPosTagger()
+        >>> tagger.pos_tag_many(['Atsa ea piai', 'Atsa ea piai'])
+        [['NOUN', 'PRON', 'VERB'], ['NOUN', 'PRON', 'VERB']]
+
+    """
+        sentences = list(sentences)
+        found = {}
+        if self.persistent_cache is not None:
+            found = self.persistent_cache.get_many('pos', self.fingerprint, sentences)
+        # repeated sentences are tagged once
+        missing = list(collections.OrderedDict.fromkeys(sentence for sentence in sentences if sentence not in found))
+        tagged = {}
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            tagged.update(zip(chunk, self.predict_tags_many(chunk)))
+        if self.persistent_cache is not None and tagged:
+            self.persistent_cache.put_many('pos', self.fingerprint, tagged.items())
+        found.update(tagged)
+        return [list(found[sentence]) for sentence in sentences]
+
+    def predict_tags_many(self, sentences):
+        """ Inner method that predicts the pos-tags of several shipibo sentences with the model, position by position
+
+        :param sentences: sentences in shipibo-konibo
+        :type sentences: list
+        :returns: list with the list of the tags of each sentence
+        :rtype: list
+    """
+        tokens = [sentence.split(" ") for sentence in sentences]
+        if self.decoder != 'greedy':
+            # the words of all the sentences are scored together and each sentence is decoded on its own
+            scores = self.static_scores([(words, i) for words in tokens for i in range(len(words))])
+            tags = []
+            start = 0
+            for words in tokens:
+                tags.append(self.decode(np.array(scores[start:start + len(words)])))
+                start += len(words)
+            return tags
+        tags = [[''] * len(words) for words in tokens]
+        # with the longest sentences first the ones still active at a position are always a prefix
+        order = sorted(range(len(tokens)), key=lambda k: -len(tokens[k]))
+        active = len(order)
+        for i in range(len(tokens[order[0]]) if order else 0):
+            while len(tokens[order[active - 1]]) <= i:
+                active -= 1
+            if self.score_cache is not None:
+                rows = np.array([self.history_rows(tags[k], i) for k in order[:active]]).reshape(-1, 2)
+                scores = np.array(self.static_scores([(tokens[k], i) for k in order[:active]]))
+                scores += self.history[0][rows[:, 0]] + self.history[1][rows[:, 1]]
+                predicted = self.linear.classes_[scores.argmax(axis=1)]
+            else:
+                feats = [self.features(tokens[k], tags[k], i) for k in order[:active]]
+                predicted = self.postagger.predict(feats)
+            for k, tag_predicted in zip(order[:active], predicted):
+                tags[k][i] = tag_predicted
+        return tags
+
     def full_pos_tag(self, sentence):
         """ Method that predict the pos-tags of a shipibo sentence and returns the full tag in spanish
 
@@ -146,4 +647,271 @@ class ShipiboPosTagger:
         elif pos == "VERB": return  "Verbo"
         elif pos == "AUX" : return  "Verbo Auxiliar"
         return "Desconocido"
-   
+
+
+def iter_conllu(path):
+    """ Function that reads the tagged sentences of a treebank in the CoNLL-U format one at a time
+
+    :param path: path of the treebank
+    :type path: str
+    :returns: generator of the sentences as lists of (word, universal tag) pairs
+    :rtype: generator
+    """
+    sentence = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                if sentence:
+                    yield sentence
+                    sentence = []
+            elif not line.startswith('#'):
+                fields = line.split('\t')
+                # the multiword tokens and the empty nodes have no tag of their own
+                if fields[0].isdigit():
+                    sentence.append((fields[1], fields[3]))
+    if sentence:
+        yield sentence
+
+
+class GeneralPosTagger(ShipiboPosTagger):
+    """
+    Part-of-speech tagger trained with mini-batch stochastic gradient descent on a stream of tagged sentences.
+    It uses the features of ShipiboPosTagger hashed into a fixed number of columns, so the memory depends on
+    the number of columns and the batch size but not on the corpus, and it tags with the same decoders
+    """
+
+    def __init__(self, path = None, classes = None, n_features = 2 ** 18, batch_size = 256, learning_rate = 0.1, alpha = 1e-6,
+                 persistent_cache = None, score_cache_size = 0, decoder = 'greedy', beam_width = 4):
+        """ Constructor of the GeneralPosTagger class with a new model or one saved by the save method
+
+        :param path: directory of a saved model, None to start a new one
+        :type path: str
+        :param classes: tags known before the training of a new model, the other tags are added when they are found
+        :type classes: list
+        :param n_features: number of columns the features of a new model are hashed into
+        :type n_features: int
+        :param batch_size: number of words of each update of the weights
+        :type batch_size: int
+        :param learning_rate: initial step of the updates
+        :type learning_rate: float
+        :param alpha: strength of the L2 regularization, it also makes the step decrease with the updates
+        :type alpha: float
+        :param persistent_cache: store shared across runs and processes for the tags of each sentence, None to disable it
+        :type persistent_cache: PersistentCache
+        :param score_cache_size: maximum number of word contexts whose scores without the previous tags are kept, 0 to score every word with the model
+        :type score_cache_size: int
+        :param decoder: 'greedy', 'beam' or 'viterbi', as in ShipiboPosTagger
+        :type decoder: str
+        :param beam_width: number of sequences kept at each word by the beam decoder
+        :type beam_width: int
+    """
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least 1, not %r" % (batch_size,))
+        self.set_decoder(decoder, beam_width)
+        if path is None:
+            classes = [str(tag) for tag in classes or []]
+            model = LinearModel({}, np.zeros((n_features, len(classes))), np.zeros(len(classes)), classes, n_features=n_features)
+        else:
+            model = LinearModel.load(path)
+        self.backend = 'numpy'
+        self.postagger = model
+        # a new model can not tag until it has been trained with some words
+        self.fitted = path is not None
+        self.class_rows = {str(tag): row for row, tag in enumerate(model.classes_)}
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.alpha = alpha
+        self.updates = 0
+        # the weights of the model are scale times the stored ones, so the regularization does not touch every weight at each update
+        self.scale = 1.0
+        self.persistent_cache = persistent_cache
+        self.score_cache = LRUCache(score_cache_size) if score_cache_size else None
+        self.trained()
+
+    def trained(self):
+        """ Inner method that prepares the tagger to tag with the current weights
+
+        :returns: none
+        :rtype: None
+    """
+        self.unscale()
+        self.split_model(self.postagger)
+        self.fingerprint = None
+        if self.persistent_cache is not None:
+            model = self.postagger
+            digest = hashlib.sha1(json.dumps([[str(tag) for tag in model.classes_], model.separator, model.n_features,
+                                              model.vocabulary], ensure_ascii=False, sort_keys=True).encode('utf-8'))
+            digest.update(np.ascontiguousarray(model.weights).tobytes())
+            digest.update(np.ascontiguousarray(model.intercept).tobytes())
+            self.fingerprint = digest.hexdigest() + self.decoder_key()
+
+    def unscale(self):
+        """ Inner method that applies the pending regularization to the stored weights
+
+        :returns: none
+        :rtype: None
+    """
+        if self.scale != 1.0:
+            self.postagger.weights *= self.scale
+            self.scale = 1.0
+
+    def class_row(self, tag):
+        """ Inner method that returns the column of the scores of a tag, adding the tag to the model if it is new
+
+        :param tag: a pos tag
+        :type tag: str
+        :returns: the column of the tag
+        :rtype: int
+    """
+        row = self.class_rows.get(tag)
+        if row is None:
+            model = self.postagger
+            row = len(self.class_rows)
+            self.class_rows[tag] = row
+            model.weights = np.hstack([model.weights, np.zeros((len(model.weights), 1), dtype=model.weights.dtype)])
+            model.intercept = np.append(model.intercept, 0.0)
+            model.classes_ = np.array([str(known) for known in model.classes_] + [tag])
+        return row
+
+    def update(self, feats, targets):
+        """ Inner method that takes a step of gradient descent on the log-loss of the softmax of the scores of a batch of words
+
+        :param feats: features of each word
+        :type feats: list
+        :param targets: column of the tag of each word
+        :type targets: list
+        :returns: none
+        :rtype: None
+    """
+        model = self.postagger
+        columns = []
+        values = []
+        rows = []
+        for row, feature in enumerate(feats):
+            row_columns, row_values = model.columns(feature)
+            columns.extend(row_columns)
+            values.extend(row_values)
+            rows.extend([row] * len(row_columns))
+        columns = np.array(columns, dtype=np.intp)
+        values = np.array(values, dtype=model.weights.dtype)
+        rows = np.array(rows, dtype=np.intp)
+        contributions = model.weights[columns] * values[:, None]
+        scores = np.tile(model.intercept, (len(feats), 1))
+        if len(columns):
+            # the columns of each word are contiguous
+            present, starts = np.unique(rows, return_index=True)
+            scores[present] += self.scale * np.add.reduceat(contributions, starts)
+        gradient = np.exp(log_softmax(scores))
+        gradient[np.arange(len(targets)), targets] -= 1
+        gradient /= len(targets)
+        rate = self.learning_rate / (1 + self.learning_rate * self.alpha * self.updates)
+        self.updates += 1
+        self.scale *= 1 - rate * self.alpha
+        # a column can appear several times in a batch
+        np.add.at(model.weights, columns, (-rate / self.scale) * values[:, None] * gradient[rows])
+        model.intercept -= rate * gradient.sum(axis=0)
+        if self.scale < 1e-9:
+            self.unscale()
+
+    def partial_fit(self, sentences):
+        """ Method that trains the model with one pass over tagged sentences that are read one at a time,
+        the weights are updated after every batch_size words
+
+        :param sentences: sentences as lists of (word, tag) pairs, like the ones of iter_conllu
+        :type sentences: iterable
+        :returns: the tagger
+        :rtype: GeneralPosTagger
+
+        :Example:
+
+        >>> import chana.pos_tagger
+        >>> tagger = chana.pos_tagger.GeneralPosTagger(n_features=2 ** 12, batch_size=2)
+        >>> tagger = tagger.partial_fit([[('Atsa', 'NOUN'), ('ea', 'PRON'), ('piai', 'VERB')]] * 20)
+        >>> tagger.pos_tag('Atsa ea piai')
+        ['NOUN', 'PRON', 'VERB']
+
+    """
+        feats = []
+        targets = []
+        for sentence in sentences:
+            tokens = [word for word, tag in sentence]
+            tags = [str(tag) for word, tag in sentence]
+            # the features of a word use the true tags of the previous words
+            for i in range(len(tokens)):
+                feats.append(self.features(tokens, tags, i))
+                targets.append(self.class_row(tags[i]))
+                if len(feats) == self.batch_size:
+                    self.update(feats, targets)
+                    feats = []
+                    targets = []
+        if feats:
+            self.update(feats, targets)
+        self.fitted = self.fitted or self.updates > 0
+        self.trained()
+        return self
+
+    def fit(self, sentences, epochs = 1):
+        """ Method that trains the model with several passes over tagged sentences
+
+        :param sentences: sentences as lists of (word, tag) pairs, with more than one epoch it must be possible
+            to iterate over them again, like a list or an object that reads a file each time it is iterated
+        :type sentences: iterable
+        :param epochs: number of passes over the sentences
+        :type epochs: int
+        :returns: the tagger
+        :rtype: GeneralPosTagger
+    """
+        if epochs > 1 and iter(sentences) is sentences:
+            raise ValueError("The sentences of several epochs can not be read from an iterator that is consumed by the first one")
+        for _ in range(epochs):
+            self.partial_fit(sentences)
+        return self
+
+    def pos_tag(self, sentence):
+        """ Method that predict the pos-tags of a sentence with the trained model
+
+        :param sentence: a sentence
+        :type sentence: str
+        :returns: list of the tags
+        :rtype: list
+    """
+        if not self.fitted:
+            return 'The pos tagger must be trained first'
+        return ShipiboPosTagger.pos_tag(self, sentence)
+
+    def pos_tag_many(self, sentences, chunk_size = 1024):
+        """ Method that predict the pos-tags of several sentences with the trained model
+
+        :param sentences: sentences to be tagged
+        :type sentences: iterable
+        :param chunk_size: number of sentences decoded together
+        :type chunk_size: int
+        :returns: list with the list of the tags of each sentence, in the order of the sentences
+        :rtype: list
+    """
+        if not self.fitted:
+            return 'The pos tagger must be trained first'
+        return ShipiboPosTagger.pos_tag_many(self, sentences, chunk_size)
+
+    def full_pos_tag(self, sentence):
+        """ Method that predict the pos-tags of a sentence with the trained model and returns the full tags in spanish
+
+        :param sentence: a sentence
+        :type sentence: str
+        :returns: list of the tags in spanish
+        :rtype: list
+    """
+        if not self.fitted:
+            return 'The pos tagger must be trained first'
+        return ShipiboPosTagger.full_pos_tag(self, sentence)
+
+    def save(self, path):
+        """ Method that saves the model in the directory format of LinearModel, to be loaded with GeneralPosTagger(path)
+
+        :param path: directory of the model, it is created if it does not exist
+        :type path: str
+        :returns: none
+        :rtype: None
+    """
+        self.postagger.save(path)
@@ -3,11 +3,15 @@
 Syllabificator for shipibo-konibo.
 General functions and rules to syllabify a shipibo-konibo word
 """
-def syllabify(word):
+from .cache import model_fingerprint
+
+def syllabify(word, persistent_cache = None):
     """ Function that returns all the syllables of a word
 
         :param word: a word to get its syllables
         :type word: str
+        :param persistent_cache: store shared across runs and processes for the syllables, None to disable it
+        :type persistent_cache: PersistentCache
         :returns: list of syllables
         :rtype: list
 
@@ -18,6 +22,14 @@ def syllabify(word):
         ['a', 'tsa', 'bo']
 
     """
+    if persistent_cache is not None:
+        # the rules are the model of the syllabificator
+        fingerprint = model_fingerprint(__file__)
+        syllables = persistent_cache.get('syllables', fingerprint, word)
+        if syllables is None:
+            syllables = syllabify(word)
+            persistent_cache.put('syllables', fingerprint, word, syllables)
+        return syllables
     word_vc = get_vc(word)
     sibilantes = ['m','n', 's', 'sh', 'x']
     syllables = []